@@ -4,6 +4,8 @@ BWV Processing Tasks - Complete build system for Bach scores
 """
 
 # Import all generated tasks from the auto-generated file
+# (eagerly: invoke builds its task collection from this module's attributes,
+#  and status/clean/info live in the generated file too)
 try:
     from tasks_generated import *
     print("✅ Loaded generated tasks from tasks_generated.py")
@@ -4,137 +4,250 @@ Tasks Mermaid Generator - Focused on task generation from mermaid files
 """
 
 import argparse
+import hashlib
+import heapq
+import json
+import logging
+import os
+import re
 import sys
 import textwrap
 from pathlib import Path
-from antlr4 import *
 
-# Import generated ANTLR classes
+# Import the cached ANTLR parser from tasks_mermaid_utils (single place that
+# drives the generated lexer/parser)
 try:
-    from antlr.MermaidPipelineLexer import MermaidPipelineLexer
-    from antlr.MermaidPipelineParser import MermaidPipelineParser
-    from antlr.MermaidPipelineParserListener import MermaidPipelineParserListener
+    from tasks_mermaid_utils import load_mermaid, _PARSER_HASH
 except ImportError as e:
-    print(f"❌ Error importing ANTLR classes: {e}")
-    sys.exit(1)
-
-# Import the existing listener from tasks_mermaid_utils
-try:
-    from tasks_mermaid_utils import MermaidDisplayListener
-except ImportError as e:
-    print(f"❌ Error importing MermaidDisplayListener: {e}")
+    print(f"❌ Error importing tasks_mermaid_utils: {e}")
     print("   Make sure tasks_mermaid_utils.py is in the same directory")
     sys.exit(1)
 
+# Verbose tracing of how tasks are mapped to files and commands (-v or MERMAID_DEBUG=1)
+log = logging.getLogger('mermaid_generator')
+
+# "bwv_script:script_name.py arg1 arg2 ..." runnable commands
+_BWV_SCRIPT_RE = re.compile(r'^bwv_script:(\S+)(.*)$', re.DOTALL)
+
+# Generated input files (e.g. ties.csv): ".csv" suffix, or "generated" in any case
+_GENERATED_RE = re.compile(r'\.csv\Z|(?i:generated)')
+
+# Empty id set for types absent from the diagram
+_NO_IDS = frozenset()
+
+# Shared LilyPond includes, mounted into the container at /work/includes
+LILYPOND_INCLUDES = (Path(__file__).parent / ".." / "lilypond" / "includes").resolve()
+
+# Docker runnable placeholders and their replacements in generated commands
+_DOCKER_SUBSTITUTIONS = {
+    'BWV000': '{PROJECT_NAME}',                                            # project name
+    'PWD': '{PROJECT_DIR}',                                                # project directory
+    'docker run': f'docker run -v {LILYPOND_INCLUDES}:/work/includes',     # includes volume
+    'INCLUDES': '-I /work/includes',                                       # include flag
+}
+_DOCKER_PLACEHOLDER_RE = re.compile('|'.join(re.escape(k) for k in _DOCKER_SUBSTITUTIONS))
+
+def _docker_substitution(match):
+    """Replacement for one placeholder matched by _DOCKER_PLACEHOLDER_RE."""
+    return _DOCKER_SUBSTITUTIONS[match.group()]
+
+def _fstring_expr(filename):
+    """Source for a filename as an f-string literal with the project name filled in."""
+    filename = filename.replace('BWV000', '{PROJECT_NAME}')
+    return f'f"{filename}"'
+
+def _path_expr(filename):
+    """Source for a Path(...) of a filename; only placeholders need an f-string."""
+    if 'BWV000' in filename:
+        return f'Path({_fstring_expr(filename)})'
+    return f'Path("{filename}")'
+
 # =============================================================================
 # TASK GENERATION FUNCTIONS
 # =============================================================================
 
-def get_node_by_id(nodes, node_id):
-    """Get node by its ID."""
-    return next((n for n in nodes if n['id'] == node_id), None)
+def build_nodes_by_id(nodes):
+    """Index nodes by ID: {node_id: node}; the first declaration of an ID wins."""
+    nodes_by_id = {}
+    for node in nodes:
+        nodes_by_id.setdefault(node.id, node)
+    return nodes_by_id
 
-def get_nodes_by_type(nodes, node_type):
-    """Get all nodes of a specific type."""
-    return [n for n in nodes if n['type'] == node_type]
+def get_node_by_id(nodes_by_id, node_id):
+    """Get node by its ID (see build_nodes_by_id)."""
+    return nodes_by_id.get(node_id)
 
 def get_final_tasks_from_listener(listener):
     """Get list of task names that produce final exports from a parsed listener."""
     final_tasks = []
     
-    # Find all export nodes (E*)
-    export_nodes = [node['id'] for node in listener.nodes if node['type'] == 'E']
+    # Node ids per type, so edge endpoints are classified with a set lookup
+    runnable_ids = listener.ids_by_type.get('R', _NO_IDS)
+    task_ids = listener.ids_by_type.get('T', _NO_IDS)
     
-    # For each export, trace back to find the task that produces it
-    for export_id in export_nodes:
+    # For each export (E*), trace back to find the task that produces it
+    for export_node in listener.nodes_by_type.get('E', []):
         # Find runnable that produces this export (R -> E)
-        producing_runnable = None
-        for from_node, to_node in listener.edges:
-            if to_node == export_id and from_node.startswith('R'):
-                producing_runnable = from_node
-                break
+        producing_runnable = next(
+            (src for src in listener.predecessors.get(export_node.id, []) if src in runnable_ids),
+            None
+        )
         
         if producing_runnable:
             # Find task that produces this runnable (T -> R)
-            for from_node, to_node in listener.edges:
-                if to_node == producing_runnable and from_node.startswith('T'):
-                    task_node = get_node_by_id(listener.nodes, from_node)
-                    if task_node:
-                        final_tasks.append(task_node['content'])
+            for src in listener.predecessors.get(producing_runnable, []):
+                if src in task_ids:
+                    final_tasks.append(listener.nodes_by_id[src].content)
                     break
     
     # Remove duplicates and return
-    return list(set(final_tasks))
+    return list(dict.fromkeys(final_tasks))
+
+def build_predecessors(edges):
+    """Index edges by target: {node_id: [source node_id, ...]} in edge order."""
+    predecessors = {}
+    for from_node, to_node in edges:
+        predecessors.setdefault(to_node, []).append(from_node)
+    return predecessors
+
+def build_successors(edges):
+    """Index edges by source: {node_id: [target node_id, ...]} in edge order."""
+    successors = {}
+    for from_node, to_node in edges:
+        successors.setdefault(from_node, []).append(to_node)
+    return successors
+
+def build_ids_by_type(nodes, edges):
+    """
+    Index node ids by type: {'T': {task ids}, 'R': {...}, ...}.
+    Ids that only appear in edges are classified by their first letter, like
+    declared nodes, so type checks become set lookups.
+    """
+    ids_by_type = {}
+    for node in nodes:
+        ids_by_type.setdefault(node.type, set()).add(node.id)
+    for edge in edges:
+        for node_id in edge:
+            ids_by_type.setdefault(node_id[:1], set()).add(node_id)
+    return ids_by_type
 
-def trace_task_dependencies(task_id, edges, nodes):
+def trace_task_dependencies(task_id, predecessors, ids_by_type, nodes_by_id):
     """
     Trace task dependencies by following the graph.
     Returns list of task function names that this task depends on.
+    
+    The graph indices (see build_predecessors, build_ids_by_type,
+    build_nodes_by_id) are built once by the caller, not once per task.
     """
-    dependencies = []
+    task_ids = ids_by_type.get('T', _NO_IDS)
+    # Insertion-ordered set: a task reachable through several paths counts
+    # once, and the emitted pre=[...] order is stable across runs
+    dependencies = {}
     
     # Strategy: Follow the pipeline flow backwards
     # For each task, find what it needs to run before it
     
     # Method 1: Direct task dependencies (T -> T)
-    for from_node, to_node in edges:
-        if to_node == task_id and from_node.startswith('T'):
-            dep_task = get_node_by_id(nodes, from_node)
+    for from_node in predecessors.get(task_id, []):
+        if from_node in task_ids:
+            dep_task = get_node_by_id(nodes_by_id, from_node)
             if dep_task:
-                dependencies.append(dep_task['content'])
+                dependencies[dep_task.content] = None
     
     # Method 2: Dependencies through outputs (O -> T means T depends on whatever creates O)
-    for from_node, to_node in edges:
-        if to_node == task_id and from_node.startswith('O'):
+    for from_node in predecessors.get(task_id, []):
+        if from_node in ids_by_type.get('O', _NO_IDS):
             # Find what runnable creates this output
-            for r_from, r_to in edges:
-                if r_to == from_node and r_from.startswith('R'):
+            for r_from in predecessors.get(from_node, []):
+                if r_from in ids_by_type.get('R', _NO_IDS):
                     # Find what task creates this runnable
-                    for t_from, t_to in edges:
-                        if t_to == r_from and t_from.startswith('T'):
-                            dep_task = get_node_by_id(nodes, t_from)
+                    for t_from in predecessors.get(r_from, []):
+                        if t_from in task_ids:
+                            dep_task = get_node_by_id(nodes_by_id, t_from)
                             if dep_task:
-                                dependencies.append(dep_task['content'])
+                                dependencies[dep_task.content] = None
     
-    # Remove duplicates and return
-    return list(set(dependencies))
+    return list(dependencies)
+
+def topological_sort_tasks(task_nodes, edges):
+    """
+    Sort tasks so that dependencies come before dependents (Kahn's algorithm).
+    Tasks are emitted level by level in declaration order, so the generated
+    file stays stable across runs.
+    """
+    predecessors = build_predecessors(edges)
+    ids_by_type = build_ids_by_type(task_nodes, edges)
+    nodes_by_id = build_nodes_by_id(task_nodes)
+    dependencies = {
+        task.id: trace_task_dependencies(task.id, predecessors, ids_by_type, nodes_by_id)
+        for task in task_nodes
+    }
+    
+    # Common case: independent tasks keep their declaration order
+    if not any(dependencies.values()):
+        return list(task_nodes)
+    
+    name_to_id = {task.content: task.id for task in task_nodes}
+    position = {task.id: i for i, task in enumerate(task_nodes)}
+    in_degree = {}
+    dependents = {task.id: [] for task in task_nodes}
+    for task_id, dep_names in dependencies.items():
+        in_degree[task_id] = len(dep_names)
+        for dep_name in dep_names:
+            dependents[name_to_id[dep_name]].append(task_id)
+    
+    # Min-heap on (level, declaration position): pops tasks level by level,
+    # each level in declaration order
+    sorted_ids = []
+    emitted = set()
+    level = 0
+    ready = [(0, position[task_id], task_id) for task_id in position if in_degree[task_id] == 0]
+    heapq.heapify(ready)
+    
+    while len(sorted_ids) < len(position):
+        if not ready:
+            # If no tasks are ready, just take the first one to avoid infinite loop
+            stuck = next(task for task in task_nodes if task.id not in emitted)
+            print(f"⚠️  Warning: Potential circular dependency, adding {stuck.content} anyway")
+            ready = [(level + 1, position[stuck.id], stuck.id)]
+        
+        level, _, task_id = heapq.heappop(ready)
+        sorted_ids.append(task_id)
+        emitted.add(task_id)
+        
+        for dependent in dependents[task_id]:
+            in_degree[dependent] -= 1
+            if in_degree[dependent] == 0 and dependent not in emitted:
+                heapq.heappush(ready, (level + 1, position[dependent], dependent))
+    
+    nodes_by_id = {task.id: task for task in task_nodes}
+    return [nodes_by_id[task_id] for task_id in sorted_ids]
 
-def get_task_sources(task_id, edges, nodes):
+def get_task_sources(task_id, predecessors, ids_by_type, nodes_by_id):
    """
    Determine source files for a task based on input dependencies.
    Returns the complete sources expression as a string for direct use in code generation.
    """
-   print(f"🔍 DEBUG get_task_sources for {task_id}")
+   log.debug("🔍 DEBUG get_task_sources for %s", task_id)
    path_sources = []
    
    # Find inputs that flow to this task
-   for from_node, to_node in edges:
-       if to_node == task_id:
-           print(f"   Found edge: {from_node} -> {to_node}")
-           if from_node.startswith('I'):
-               print(f"   Processing Input: {from_node}")
-               # Direct input files (I -> T)
-               input_node = get_node_by_id(nodes, from_node)
-               if input_node:
-                   filename = input_node['content']
-                   if 'BWV000' in filename:
-                       filename = filename.replace('BWV000', '{PROJECT_NAME}')
-                       path_sources.append(f'Path(f"{filename}")')
-                   else:
-                       path_sources.append(f'Path("{filename}")')
-           elif from_node.startswith('O'):
-               print(f"   Processing Output: {from_node}")
-               # Output files from previous tasks (O -> T)
-               output_node = get_node_by_id(nodes, from_node)
-               if output_node:
-                   filename = output_node['content']
-                   if 'BWV000' in filename:
-                       filename = filename.replace('BWV000', '{PROJECT_NAME}')
-                       path_sources.append(f'Path(f"{filename}")')
-                   else:
-                       path_sources.append(f'Path("{filename}")')
-                       
-   print(f"   Final path_sources: {path_sources}")
+   for from_node in predecessors.get(task_id, []):
+       log.debug("   Found edge: %s -> %s", from_node, task_id)
+       if from_node in ids_by_type.get('I', _NO_IDS):
+           log.debug("   Processing Input: %s", from_node)
+           # Direct input files (I -> T)
+           input_node = get_node_by_id(nodes_by_id, from_node)
+           if input_node:
+               path_sources.append(_path_expr(input_node.content))
+       elif from_node in ids_by_type.get('O', _NO_IDS):
+           log.debug("   Processing Output: %s", from_node)
+           # Output files from previous tasks (O -> T)
+           output_node = get_node_by_id(nodes_by_id, from_node)
+           if output_node:
+               path_sources.append(_path_expr(output_node.content))
+                   
+   log.debug("   Final path_sources: %s", path_sources)
    # Rest stays the same...
    
    # Check if we have .ly files to determine if we need shared sources
@@ -152,118 +265,110 @@ def get_task_sources(task_id, edges, nodes):
    else:
        return '[]'
 
-def get_task_targets(task_id, edges, nodes):
+def get_task_targets(task_id, successors, ids_by_type, nodes_by_id):
     """
     Determine target files for a task based on runnable->output/export dependencies.
     """
+    runnable_ids = ids_by_type.get('R', _NO_IDS)
     targets = []
     
     # Find the runnable that this task produces (T -> R)
-    runnable_id = None
-    for from_node, to_node in edges:
-        if from_node == task_id and to_node.startswith('R'):
-            runnable_id = to_node
-            break
+    runnable_id = next((to_node for to_node in successors.get(task_id, []) if to_node in runnable_ids), None)
     
     # Find outputs/exports that this runnable produces (R -> O or R -> E)
     if runnable_id:
-        for from_node, to_node in edges:
-            if from_node == runnable_id and (to_node.startswith('O') or to_node.startswith('E')):
-                target_node = get_node_by_id(nodes, to_node)
+        for to_node in successors.get(runnable_id, []):
+            if to_node in ids_by_type.get('O', _NO_IDS) or to_node in ids_by_type.get('E', _NO_IDS):
+                target_node = get_node_by_id(nodes_by_id, to_node)
                 if target_node:
                     # Extract filename from content and fix BWV000 placeholder
-                    filename = target_node['content']
-                    filename = filename.replace('BWV000', '{PROJECT_NAME}')
-                    targets.append(f'f"{filename}"')
+                    targets.append(_fstring_expr(target_node.content))
     
     # If no targets found through runnables, check if task has direct input connections
     # that might indicate file generation (like extract_ties creating CSV files)
     if not targets:
-        # Look for any python_func commands that include "-o" output flags
-        command = get_task_command(task_id, edges, nodes)
-        if command and 'run_bwv_script' in command and '"-o"' in command:
-            # Extract output filename from the command
-            # Pattern: run_bwv_script("script.py", "-i", "input.svg", "-o", "output.csv")
-            import re
-            output_match = re.search(r'"-o",\s*f?"([^"]+)"', command)
-            if output_match:
-                filename = output_match.group(1)
-                targets.append(f'f"{filename}"')
+        # Look for any bwv_script commands that include "-o" output flags
+        runnable = get_task_runnable(task_id, nodes_by_id, successors, runnable_ids)
+        if runnable and runnable[0] == 'bwv_script':
+            # Pattern: bwv_script:script.py -i input.svg -o output.csv
+            _, args = runnable[1]
+            output_index = next((i + 1 for i, arg in enumerate(args[:-1]) if arg == '-o'), None)
+            if output_index:
+                targets.append(f'f"{args[output_index]}"')
     
     return targets
 
-def get_task_command(task_id, edges, nodes):
+def get_task_runnable(task_id, nodes_by_id, successors, runnable_ids):
     """
-    Get the command for a task by finding its corresponding runnable.
+    Find the runnable a task maps to (T -> R) and split it into its parts.
+    
+    Returns:
+        ('docker', command) with all placeholders substituted,
+        ('bwv_script', (script_name, args)) with args as a tuple, or None
     """
-    # Find the runnable that this task maps to (T -> R)
-    for from_node, to_node in edges:
-        if from_node == task_id and to_node.startswith('R'):
-            runnable_node = get_node_by_id(nodes, to_node)
+    for to_node in successors.get(task_id, []):
+        if to_node in runnable_ids:
+            runnable_node = get_node_by_id(nodes_by_id, to_node)
             if runnable_node:
-                command = runnable_node['content']
-                print(f"   Raw command: '{command}'")
+                command = runnable_node.content
+                log.debug("   Raw command: '%s'", command)
                 
                 # Check if it's a Docker command or Python script
-                if 'docker' in command.lower() and 'run' in command.lower():
-                    # Handle Docker command (fix spacing issues if needed)
-                    # Replace project name placeholder and fix path
-                    command = command.replace('BWV000', '{PROJECT_NAME}')
-                    command = command.replace('PWD', f'{{Path.cwd()}}')
-
-                    # Add lilypond includes volume mount to /work/includes
-                    lilypond_includes_path = Path(__file__).parent / ".." / "lilypond" / "includes"
-                    lilypond_includes_abs = lilypond_includes_path.resolve()
-                    
-                    # Insert the lilypond volume right after "docker run"
-                    command = command.replace('docker run', f'docker run -v {lilypond_includes_abs}:/work/includes')
-                    
-                    # Replace INCLUDES marker with the actual include flag
-                    command = command.replace('INCLUDES', '-I /work/includes')
-                                            
-                    return f'f"{command}"'
+                lowered = command.lower()
+                if 'docker' in lowered and 'run' in lowered:
+                    # Handle Docker command: substitute all placeholders in one pass
+                    return 'docker', _DOCKER_PLACEHOLDER_RE.sub(_docker_substitution, command)
                 
-                elif command.startswith('bwv_script:'):
+                elif (bwv_match := _BWV_SCRIPT_RE.match(command)):
                     # Extract script name and arguments  
                     # Format: "bwv_script:script_name.py arg1 arg2 ..."
-                    parts = command.split()
-                    script_part = parts[0]  # "bwv_script:script_name.py"
-                    script_name = script_part.replace('bwv_script:', '')
-                    args = parts[1:] if len(parts) > 1 else []
+                    script_name, rest = bwv_match.groups()
                     
                     # Replace project name in arguments
-                    args = [arg.replace('BWV000', '{PROJECT_NAME}') for arg in args]
-                    
-                    if args:
-                        args_str = ', '.join(f'f"{arg}"' for arg in args)
-                        return f'run_bwv_script("{script_name}", {args_str})'
-                    else:
-                        return f'run_bwv_script("{script_name}")'
+                    args = tuple(arg.replace('BWV000', '{PROJECT_NAME}') for arg in rest.split())
+                    return 'bwv_script', (script_name, args)
     
     return None
 
-def debug_task_mapping(task_id, edges, nodes):
+def get_task_command(task_id, successors, ids_by_type, nodes_by_id):
+    """
+    Get the command for a task by finding its corresponding runnable.
+    """
+    
+    runnable = get_task_runnable(task_id, nodes_by_id, successors, ids_by_type.get('R', _NO_IDS))
+    if runnable is None:
+        return None
+    
+    kind, value = runnable
+    if kind == 'docker':
+        return f'f"{value}"'
+    
+    script_name, args = value
+    if args:
+        args_str = ', '.join(f'f"{arg}"' for arg in args)
+        return f'run_bwv_script("{script_name}", {args_str})'
+    else:
+        return f'run_bwv_script("{script_name}")'
+
+def debug_task_mapping(task_id, successors, predecessors, ids_by_type, nodes_by_id):
     """Debug function to see what's happening with task mapping."""
-    print(f"\n🔍 Debug task {task_id}:")
+    log.debug("\n🔍 Debug task %s:", task_id)
     
     # Show edges from this task
-    task_edges = [(f, t) for f, t in edges if f == task_id]
-    print(f"   Edges from {task_id}: {task_edges}")
+    task_edges = [(task_id, t) for t in successors.get(task_id, [])]
+    log.debug("   Edges from %s: %s", task_id, task_edges)
     
     # Show edges to this task  
-    to_task_edges = [(f, t) for f, t in edges if t == task_id]
-    print(f"   Edges to {task_id}: {to_task_edges}")
+    to_task_edges = [(f, task_id) for f in predecessors.get(task_id, [])]
+    log.debug("   Edges to %s: %s", task_id, to_task_edges)
     
     # Try to find runnable
-    runnable = None
-    for from_node, to_node in edges:
-        if from_node == task_id and to_node.startswith('R'):
-            runnable = get_node_by_id(nodes, to_node)
-            break
+    runnable_id = next((t for t in successors.get(task_id, []) if t in ids_by_type.get('R', _NO_IDS)), None)
+    runnable = get_node_by_id(nodes_by_id, runnable_id) if runnable_id else None
     
-    print(f"   Found runnable: {runnable['id'] if runnable else 'None'}")
+    log.debug("   Found runnable: %s", runnable.id if runnable else 'None')
     if runnable:
-        print(f"   Runnable content: {runnable['content']}")
+        log.debug("   Runnable content: %s", runnable.content)
     
     return runnable
 
@@ -277,33 +382,33 @@ def generate_status_task(listener):
     status_files = []
     
     # Get export nodes
-    export_nodes = get_nodes_by_type(listener.nodes, 'E')
+    export_nodes = listener.nodes_by_type.get('E', [])
     for node in export_nodes:
-        filename = node['content'].replace('BWV000', '{PROJECT_NAME}')
-        description = node.get('description', node['content'])
+        filename = node.content.replace('BWV000', '{PROJECT_NAME}')
+        description = node.description
         status_files.append(('Export', description, filename))
     
     # Get output nodes
-    output_nodes = get_nodes_by_type(listener.nodes, 'O')
+    output_nodes = listener.nodes_by_type.get('O', [])
     for node in output_nodes:
-        filename = node['content'].replace('BWV000', '{PROJECT_NAME}')
-        description = node.get('description', node['content'])
+        filename = node.content.replace('BWV000', '{PROJECT_NAME}')
+        description = node.description
         status_files.append(('Output', description, filename))
     
     # Get input nodes that are generated (like ties.csv)
-    input_nodes = get_nodes_by_type(listener.nodes, 'I')
+    input_nodes = listener.nodes_by_type.get('I', [])
     for node in input_nodes:
-        filename = node['content'].replace('BWV000', '{PROJECT_NAME}')
+        filename = node.content.replace('BWV000', '{PROJECT_NAME}')
         # Only include generated input files (not source files)
-        if filename.endswith('.csv') or 'generated' in filename.lower():
-            description = node.get('description', node['content'])
+        if _GENERATED_RE.search(filename):
+            description = node.description
             status_files.append(('Input', description, filename))
     
     # Generate status_files list entries
-    status_entries = []
-    for category, description, filename in status_files:
-        status_entries.append(f"        ('{category}', '{description}', f'{filename}'),")
-    status_list = '\n'.join(status_entries)
+    status_list = '\n'.join(
+        f"        ('{category}', '{description}', f'{filename}'),"
+        for category, description, filename in status_files
+    )
     
     return f"""@task
 def status(c):
@@ -315,21 +420,21 @@ def status(c):
 {status_list}
     ]
     
-    # Get file info and sort by timestamp
-    file_infos = []
-    for category, description, filename in status_files:
-        file_infos.append(get_file_info(filename, description))
+    # Get file info (one directory scan per folder) and sort by timestamp
+    file_infos = get_file_infos((filename, description) for category, description, filename in status_files)
     
     # Sort by timestamp (missing files first, then by modification time)
-    file_infos.sort(key=lambda x: x[0])
+    file_infos.sort(key=itemgetter(0))
     
-    print("📊 Build Status:")
+    # Build the whole report first and print it in one write
+    lines = ["📊 Build Status:"]
     for mtime, name, filename, size, exists in file_infos:
         if exists:
             mtime_str = datetime.fromtimestamp(mtime).strftime('%Y-%m-%d %H:%M:%S')
-            print(f"   ✅ {{name:<18}}: {{filename:<75}} ({{size:>10,}} bytes, {{mtime_str}})")
+            lines.append(f"   ✅ {{name:<18}}: {{filename:<75}} ({{size:>10,}} bytes, {{mtime_str}})")
         else:
-            print(f"   ❌ {{name:<18}}: {{filename:<75}} (missing)")"""
+            lines.append(f"   ❌ {{name:<18}}: {{filename:<75}} (missing)")
+    print("\\n".join(lines))"""
 
 def generate_clean_task(listener):
     """Generate the clean task based on parsed mermaid content."""
@@ -337,30 +442,27 @@ def generate_clean_task(listener):
     target_files = []
     
     # Get export nodes
-    export_nodes = get_nodes_by_type(listener.nodes, 'E')
+    export_nodes = listener.nodes_by_type.get('E', [])
     for node in export_nodes:
-        filename = node['content'].replace('BWV000', '{PROJECT_NAME}')
+        filename = node.content.replace('BWV000', '{PROJECT_NAME}')
         target_files.append(filename)
     
     # Get output nodes
-    output_nodes = get_nodes_by_type(listener.nodes, 'O')
+    output_nodes = listener.nodes_by_type.get('O', [])
     for node in output_nodes:
-        filename = node['content'].replace('BWV000', '{PROJECT_NAME}')
+        filename = node.content.replace('BWV000', '{PROJECT_NAME}')
         target_files.append(filename)
     
     # Get generated input files (like ties.csv)
-    input_nodes = get_nodes_by_type(listener.nodes, 'I')
+    input_nodes = listener.nodes_by_type.get('I', [])
     for node in input_nodes:
-        filename = node['content'].replace('BWV000', '{PROJECT_NAME}')
+        filename = node.content.replace('BWV000', '{PROJECT_NAME}')
         # Only include generated input files
-        if filename.endswith('.csv') or 'generated' in filename.lower():
+        if _GENERATED_RE.search(filename):
             target_files.append(filename)
     
     # Generate target_files list entries
-    target_entries = []
-    for filename in target_files:
-        target_entries.append(f"        f'{filename}',")
-    target_list = '\n'.join(target_entries)
+    target_list = '\n'.join(f"        f'{filename}'," for filename in target_files)
     
     return f"""@task
 def clean(c):
@@ -376,9 +478,11 @@ def clean(c):
     deleted = []
     for filename in target_files:
         path = Path(filename)
-        if path.exists():
+        try:
             path.unlink()
-            deleted.append(path.name)
+        except FileNotFoundError:
+            continue
+        deleted.append(path.name)
     
     print("🗑️ Deleted:", end="")
     if deleted:
@@ -403,30 +507,29 @@ def generate_all_task(listener):
     
     final_tasks_list = ', '.join(f"'{task}'" for task in final_tasks)
     
-    # Generate pre= dependency list (no quotes for function references)
-    pre_dependencies = ', '.join(final_tasks)
+    # Generate task reference list (no quotes for function references)
+    final_task_refs = ', '.join(final_tasks)
     
-    return f"""@task(pre=[{pre_dependencies}])
-def all(c, force=False):
+    return f"""@task
+def all(c, force=False, jobs=1):
     \"\"\"Build all final outputs by running the complete pipeline.\"\"\"
     print(f"🎼 Building all outputs for project: {{PROJECT_NAME}}")
     
     # Final tasks that produce exports: {final_tasks_list}
-    # Dependencies handled automatically by pre=[{pre_dependencies}]
+    # Prerequisites run first; with --jobs N each task starts as soon as its own prerequisites are done
+    run_task_graph(c, TASK_DEPENDENCIES, [{final_task_refs}], force=force, jobs=jobs)
     print("🎉 All pipeline outputs completed!")"""
 
 def generate_info_task(listener):
     """Generate the info task with pipeline information."""
     # Get all task nodes for listing
-    task_nodes = get_nodes_by_type(listener.nodes, 'T')
+    task_nodes = listener.nodes_by_type.get('T', [])
     
     # Generate pipeline tasks list entries
-    pipeline_entries = []
-    for task_node in task_nodes:
-        task_name = task_node['content']
-        description = task_node.get('description', task_name.replace('_', ' ').title())
-        pipeline_entries.append(f"        ('{task_name}', '{description}'),")
-    pipeline_list = '\n'.join(pipeline_entries)
+    pipeline_list = '\n'.join(
+        f"        ('{task_node.content}', '{task_node.description}'),"
+        for task_node in task_nodes
+    )
     
     return f"""@task
 def info(c):
@@ -439,8 +542,9 @@ def info(c):
     print(f"📋 Available tasks:")
     print("   • status     - Show file status")
     print("   • clean      - Delete outputs") 
-    print("   • all        - Build all final outputs")
+    print("   • all        - Build all final outputs (--jobs N for parallel)")
     print("   • info       - This information")
+    print("   • lily_up    - Start persistent LilyPond container (lily_down to stop)")
     print("   🔧 Pipeline tasks (from tasks.mmd):")
     
     # Pipeline tasks extracted from mermaid diagram
@@ -449,10 +553,122 @@ def info(c):
     ]
     
     for task_name, description in pipeline_tasks:
-        print(f"      • {{task_name:<20}} - {{description}}")"""
+        print(f"      • {{task_name:<20}} - {{description}}")
+    
+    # Critical path from the last recorded build durations
+    durations = load_task_durations()
+    if durations:
+        total, path = critical_path(TASK_DEPENDENCIES, {{t: durations.get(t.name, 0.0) for t in TASK_DEPENDENCIES}})
+        print(f"   ⏱️  Critical path ({{total:.1f}}s): {{' → '.join(t.name for t in path)}}")"""
+
+def generate_lily_tasks():
+    """Generate the tasks that manage the persistent LilyPond container."""
+    return """@task
+def lily_up(c):
+    \"\"\"Start a persistent LilyPond container; LilyPond tasks then use docker exec.\"\"\"
+    lily_container_up(c)
+
+
+@task
+def lily_down(c):
+    \"\"\"Stop and remove the persistent LilyPond container.\"\"\"
+    lily_container_down(c)"""
+
+# =============================================================================
+# PER-TASK CODEGEN CACHE
+# =============================================================================
+
+# Generated snippets are only valid for the generator that produced them
+_GENERATOR_HASH = hashlib.blake2b(Path(__file__).read_bytes(), digest_size=16).hexdigest()
+
+# Everything besides the diagram that generated code depends on: this file,
+# the parser/listener (tasks_mermaid_utils and the ANTLR parser) and the
+# absolute includes path baked into docker commands (moves with the checkout)
+_CODEGEN_HASH = hashlib.blake2b(
+    '\0'.join((_GENERATOR_HASH, _PARSER_HASH, str(LILYPOND_INCLUDES))).encode(),
+    digest_size=16,
+).hexdigest()
+
+def task_codegen_key(task_node, listener):
+    """
+    Hash everything the code generated for a task depends on.
+    
+    Codegen for a task only looks at its neighbourhood: inputs (I/O -> T),
+    prerequisites (T -> T and T' -> R -> O -> T), its runnable and the files
+    the runnable produces (T -> R -> O/E). Edges are kept in declaration
+    order because the generator picks the first matching runnable.
+    """
+    nodes_by_id = listener.nodes_by_id
+    
+    def incoming(node_id):
+        return [(src, nodes_by_id.get(src)) for src in listener.predecessors.get(node_id, [])]
+    
+    def outgoing(node_id):
+        return [(dst, nodes_by_id.get(dst)) for dst in listener.successors.get(node_id, [])]
+    
+    task_id = task_node.id
+    upstream = []
+    for src, _ in incoming(task_id):
+        if src in listener.ids_by_type.get('O', _NO_IDS):
+            for runnable, _ in incoming(src):
+                upstream.append((src, runnable, incoming(runnable)))
+    downstream = [(dst, outgoing(dst)) for dst, _ in outgoing(task_id) if dst in listener.ids_by_type.get('R', _NO_IDS)]
+    
+    neighbourhood = [_CODEGEN_HASH, task_node, incoming(task_id), outgoing(task_id), upstream, downstream]
+    payload = json.dumps(neighbourhood, sort_keys=True, default=str)
+    return hashlib.blake2b(payload.encode(), digest_size=16).hexdigest()
+
+# Codegen cache entry recording which mermaid source produced which output
+SOURCE_DIGEST_KEY = "_source_digest"
+
+def content_digest(data):
+    """BLAKE2 digest of bytes, tied to this generator, parser and includes path."""
+    return hashlib.blake2b(_CODEGEN_HASH.encode() + data, digest_size=16).hexdigest()
+
+def is_output_current(mermaid_file, output_file, cache_file):
+    """
+    Check whether output_file was generated from the current mermaid source.
+    
+    True when the cache records this source digest and the output file still
+    has the content generated for it (i.e. it was not edited or deleted).
+    Digests include _CODEGEN_HASH, so a new generator or parser version, or
+    a moved includes path, also forces regeneration.
+    """
+    stamp = load_codegen_cache(cache_file).get(SOURCE_DIGEST_KEY)
+    if not stamp:
+        return False
+    try:
+        return stamp == {
+            'input': content_digest(Path(mermaid_file).read_bytes()),
+            'output': content_digest(Path(output_file).read_bytes()),
+        }
+    except OSError:
+        return False
 
-def generate_tasks_file(listener):
-    """Generate the tasks_generated.py file using a templating approach."""
+def load_codegen_cache(cache_file):
+    """Load cached task snippets: {key: {"dependencies": [...], "code": str}}."""
+    try:
+        return json.loads(Path(cache_file).read_text())
+    except (OSError, ValueError):
+        return {}
+
+def save_codegen_cache(cache, cache_file):
+    """Save cached task snippets atomically (write then rename)."""
+    cache_path = Path(cache_file)
+    tmp_path = cache_path.with_name(cache_path.name + '.tmp')
+    tmp_path.write_text(json.dumps(cache, indent=2))
+    os.replace(tmp_path, cache_path)
+
+def generate_tasks_file(listener, codegen_cache=None):
+    """
+    Generate the tasks_generated.py file using a templating approach.
+    
+    Args:
+        listener: Parsed mermaid diagram
+        codegen_cache: Optional dict of previously generated task snippets;
+                       tasks whose neighbourhood is unchanged are reused and
+                       the dict is updated in place with this run's snippets
+    """
     
     # Template for each task function
     TASK_TEMPLATE = textwrap.dedent("""\
@@ -474,72 +690,64 @@ def generate_tasks_file(listener):
         from invoke import task
         from pathlib import Path
         from datetime import datetime
-        from tasks_utils import smart_task, detect_project_name, flatten_tree, get_shared_ly_sources_tree, run_bwv_script, get_file_info
+        from operator import itemgetter
+        from tasks_utils import smart_task, detect_project_name, get_shared_ly_sources, run_bwv_script, get_file_infos, run_task_graph, load_task_durations, critical_path, lily_container_up, lily_container_down
 
-        # Cache project name at module level - detected only once
+        # Cache project name and directory at module level - detected only once
         PROJECT_NAME = detect_project_name()
+        PROJECT_DIR = Path.cwd()
 
 
         def shared_ly_sources():
-            \"\"\"Get shared LilyPond source dependencies.\"\"\"
-            return [Path(p) for p in flatten_tree(get_shared_ly_sources_tree(PROJECT_NAME))]
+            \"\"\"Get shared LilyPond source dependencies (scanned once per run).\"\"\"
+            return list(get_shared_ly_sources(PROJECT_NAME))
 
 
     """)
 
     # Get all task nodes
-    task_nodes = get_nodes_by_type(listener.nodes, 'T')
+    task_nodes = listener.nodes_by_type.get('T', [])
     print(f"🔍 Found {len(task_nodes)} task nodes")
 
-    # Sort task nodes to ensure dependencies are defined before they're referenced
-    def sort_tasks_by_dependencies(task_nodes, edges):
-        """Sort tasks so that dependencies come before dependents."""
-        sorted_tasks = []
-        remaining_tasks = task_nodes.copy()
-        
-        while remaining_tasks:
-            # Find tasks with no unresolved dependencies
-            ready_tasks = []
-            for task in remaining_tasks:
-                dependencies = trace_task_dependencies(task['id'], edges, task_nodes)
-                # Check if all dependencies are already in sorted_tasks
-                deps_satisfied = all(
-                    any(sorted_task['content'] == dep for sorted_task in sorted_tasks)
-                    for dep in dependencies
-                )
-                if deps_satisfied:
-                    ready_tasks.append(task)
-            
-            if not ready_tasks:
-                # If no tasks are ready, just take the first one to avoid infinite loop
-                ready_tasks = [remaining_tasks[0]]
-                print(f"⚠️  Warning: Potential circular dependency, adding {remaining_tasks[0]['content']} anyway")
-            
-            # Add ready tasks to sorted list and remove from remaining
-            for task in ready_tasks:
-                sorted_tasks.append(task)
-                remaining_tasks.remove(task)
-        
-        return sorted_tasks
-    
     # Sort tasks by dependencies
-    task_nodes = sort_tasks_by_dependencies(task_nodes, listener.edges)
+    task_nodes = topological_sort_tasks(task_nodes, listener.edges)
     print(f"🔧 Sorted tasks by dependencies")
 
     # Generate all pipeline tasks
     pipeline_tasks = []
+    task_specs = []
+    task_dependencies = []
+    previous_cache = dict(codegen_cache) if codegen_cache is not None else {}
+    if codegen_cache is not None:
+        codegen_cache.clear()
+    reused = 0
     for task_node in task_nodes:
-        task_id = task_node['id']
-        task_name = task_node['content']
-        task_description = task_node.get('description', task_name.replace('_', ' ').title())
+        task_id = task_node.id
+        task_name = task_node.content
+        
+        if codegen_cache is not None:
+            key = task_codegen_key(task_node, listener)
+            cached = previous_cache.get(key)
+            if cached:
+                task_dependencies.append((task_name, cached['dependencies']))
+                pipeline_tasks.append(cached['code'])
+                if cached['spec']:
+                    task_specs.append(cached['spec'])
+                codegen_cache[key] = cached
+                reused += 1
+                continue
+        
+        task_description = task_node.description
 
-        debug_task_mapping(task_id, listener.edges, listener.nodes)
+        if log.isEnabledFor(logging.DEBUG):
+            debug_task_mapping(task_id, listener.successors, listener.predecessors, listener.ids_by_type, listener.nodes_by_id)
 
-        dependencies = trace_task_dependencies(task_id, listener.edges, listener.nodes)
-        sources = get_task_sources(task_id, listener.edges, listener.nodes)
-        targets = get_task_targets(task_id, listener.edges, listener.nodes)
-        command = get_task_command(task_id, listener.edges, listener.nodes)
+        dependencies = trace_task_dependencies(task_id, listener.predecessors, listener.ids_by_type, listener.nodes_by_id)
+        sources = get_task_sources(task_id, listener.predecessors, listener.ids_by_type, listener.nodes_by_id)
+        targets = get_task_targets(task_id, listener.successors, listener.ids_by_type, listener.nodes_by_id)
+        command = get_task_command(task_id, listener.successors, listener.ids_by_type, listener.nodes_by_id)
 
+        task_dependencies.append((task_name, dependencies))
         decorator = f"@task(pre=[{', '.join(dependencies)}])" if dependencies else "@task"
 
         if command:
@@ -554,17 +762,17 @@ def generate_tasks_file(listener):
                 commands_param = f"[{command}]"
                 python_func_param = "None"
             
-            body = textwrap.dedent(f"""\
-                smart_task(
-                    c,
-                    sources={sources},
-                    targets=[{targets_str}],
-                    commands={commands_param},
-                    python_func={python_func_param},
-                    force=force,
-                )
-            """)
+            # Sources stay lazy so shared LilyPond includes are only scanned when a task runs
+            task_spec = textwrap.indent(textwrap.dedent(f"""\
+                '{task_name}': (
+                    lambda: {sources},
+                    [{targets_str}],
+                    {commands_param},
+                    {python_func_param},
+                ),"""), '    ')
+            body = f'run_pipeline_task(c, "{task_name}", force)\n'
         else:
+            task_spec = None
             body = "    # TODO: Add implementation - no command found\n    pass"
 
         # Indent body to match function block
@@ -578,6 +786,13 @@ def generate_tasks_file(listener):
         )
 
         pipeline_tasks.append(task_code)
+        if task_spec:
+            task_specs.append(task_spec)
+        if codegen_cache is not None:
+            codegen_cache[key] = {'dependencies': dependencies, 'code': task_code, 'spec': task_spec}
+
+    if reused:
+        print(f"♻️  Reused {reused} unchanged task(s) from codegen cache")
 
     # Generate meta-tasks
     print("🔧 Generating meta-tasks...")
@@ -587,24 +802,43 @@ def generate_tasks_file(listener):
     clean_task = generate_clean_task(listener)
     all_task = generate_all_task(listener)
     info_task = generate_info_task(listener)
+    lily_tasks = generate_lily_tasks()
     
-    # Combine all tasks with proper spacing
-    all_pipeline_tasks = '\n\n'.join(pipeline_tasks)
-    
-    # Build the complete file using template  
-    complete_file = f"""{HEADER}
-{all_pipeline_tasks}
+    # Pipeline task definitions as one table plus a shared dispatcher
+    spec_entries = '\n'.join(task_specs)
+    spec_table = f"""# Pipeline tasks extracted from mermaid diagram: name -> (sources, targets, commands, python_func)
+TASK_SPECS = {{
+{spec_entries}
+}}
 
-{status_task}
-
-{clean_task}
-
-{all_task if all_task else ""}
-
-{info_task}
-"""
 
-    return complete_file
+def run_pipeline_task(c, name, force=False):
+    \"\"\"Run a pipeline task from its TASK_SPECS entry.\"\"\"
+    sources, targets, commands, python_func = TASK_SPECS[name]
+    smart_task(
+        c,
+        task_name=name,
+        sources=sources(),
+        targets=targets,
+        commands=commands,
+        python_func=python_func,
+        force=force,
+    )"""
+    
+    # Task prerequisites as a lookup table for the 'all' scheduler
+    dependency_entries = '\n'.join(
+        f"    {task_name}: [{', '.join(dependencies)}],"
+        for task_name, dependencies in task_dependencies
+    )
+    dependency_table = f"""# Task prerequisites extracted from mermaid diagram (dependencies first)
+TASK_DEPENDENCIES = {{
+{dependency_entries}
+}}"""
+    
+    # Build the complete file in a single join (sections separated by a blank line)
+    sections = [spec_table + '\n', *pipeline_tasks, dependency_table,
+                status_task, clean_task, all_task, info_task, lily_tasks]
+    return ''.join((HEADER, '\n', '\n\n'.join(sections), '\n'))
 
 # =============================================================================
 # FILE HEADER GENERATION
@@ -623,7 +857,8 @@ Regenerate with: python tasks_mermaid_generator.py -i tasks.mmd -o meta_tasks.py
 from invoke import task
 from pathlib import Path
 from datetime import datetime
-from tasks_utils import get_file_info, detect_project_name
+from operator import itemgetter
+from tasks_utils import get_file_infos, detect_project_name, run_task_graph, load_task_durations, critical_path, lily_container_up, lily_container_down
 
 # Cache project name at module level - detected only once
 PROJECT_NAME = detect_project_name()
@@ -644,22 +879,8 @@ def generate_meta_tasks(mermaid_file):
         return ""
     
     try:
-        # Read and parse with ANTLR
-        content = mermaid_path.read_text()
-        input_stream = InputStream(content)
-        lexer = MermaidPipelineLexer(input_stream)
-        lexer.removeErrorListeners()
-        
-        stream = CommonTokenStream(lexer)
-        parser = MermaidPipelineParser(stream)
-        parser.removeErrorListeners()
-        
-        tree = parser.diagram()
-        
-        # Extract information using listener
-        listener = MermaidDisplayListener()
-        walker = ParseTreeWalker()
-        walker.walk(listener, tree)
+        # Parse with ANTLR (cached per file and mtime)
+        listener = load_mermaid(mermaid_path)
         
         print(f"✅ Parsed {len(listener.nodes)} nodes and {len(listener.edges)} edges")
         
@@ -668,23 +889,11 @@ def generate_meta_tasks(mermaid_file):
         clean_task = generate_clean_task(listener)
         all_task = generate_all_task(listener)
         info_task = generate_info_task(listener)
+        lily_tasks = generate_lily_tasks()
         
-        # Generate complete file content
-        header = generate_file_header()
-        meta_tasks = f"""{header}
-{status_task}
-
-
-{clean_task}
-
-
-{all_task}
-
-
-{info_task}
-"""
-        
-        return meta_tasks
+        # Generate complete file content in a single join
+        sections = (status_task, clean_task, all_task, info_task, lily_tasks)
+        return ''.join((generate_file_header(), '\n', '\n\n\n'.join(sections), '\n'))
         
     except Exception as e:
         print(f"❌ Error parsing mermaid file: {e}")
@@ -692,8 +901,14 @@ def generate_meta_tasks(mermaid_file):
         traceback.print_exc()
         return ""
 
-def generate_full_tasks(mermaid_file):
-    """Generate complete tasks file with both pipeline and meta tasks."""
+def generate_full_tasks(mermaid_file, cache_file=None):
+    """
+    Generate complete tasks file with both pipeline and meta tasks.
+    
+    Args:
+        mermaid_file: Input mermaid file (.mmd)
+        cache_file: Optional per-task codegen cache (e.g. .task_gen_cache.json)
+    """
     print(f"📄 Processing mermaid file for full tasks: {mermaid_file}")
     
     mermaid_path = Path(mermaid_file)
@@ -702,27 +917,20 @@ def generate_full_tasks(mermaid_file):
         return ""
     
     try:
-        # Read and parse with ANTLR
-        content = mermaid_path.read_text()
-        input_stream = InputStream(content)
-        lexer = MermaidPipelineLexer(input_stream)
-        lexer.removeErrorListeners()
-        
-        stream = CommonTokenStream(lexer)
-        parser = MermaidPipelineParser(stream)
-        parser.removeErrorListeners()
-        
-        tree = parser.diagram()
-        
-        # Extract information using listener
-        listener = MermaidDisplayListener()
-        walker = ParseTreeWalker()
-        walker.walk(listener, tree)
+        # Parse with ANTLR (cached per file and mtime)
+        listener = load_mermaid(mermaid_path)
         
         print(f"✅ Parsed {len(listener.nodes)} nodes and {len(listener.edges)} edges")
         
-        # Generate complete tasks file
-        full_tasks = generate_tasks_file(listener)
+        # Generate complete tasks file, reusing unchanged task snippets
+        codegen_cache = load_codegen_cache(cache_file) if cache_file else None
+        full_tasks = generate_tasks_file(listener, codegen_cache)
+        if cache_file:
+            codegen_cache[SOURCE_DIGEST_KEY] = {
+                'input': content_digest(mermaid_path.read_bytes()),
+                'output': content_digest(full_tasks.encode()),
+            }
+            save_codegen_cache(codegen_cache, cache_file)
         
         return full_tasks
         
@@ -754,8 +962,16 @@ Examples:
                         required=True,
                         help='Output Python file (.py)')
     
+    parser.add_argument('-v', '--verbose',
+                        action='store_true',
+                        help='Trace how tasks are mapped to files and commands')
+    
     args = parser.parse_args()
     
+    verbose = args.verbose or bool(os.environ.get('MERMAID_DEBUG'))
+    logging.basicConfig(level=logging.DEBUG if verbose else logging.WARNING,
+                        format='%(message)s', stream=sys.stdout)
+    
     # Validate input file
     input_path = Path(args.input)
     if not input_path.exists():
@@ -770,17 +986,27 @@ Examples:
     if not output_path.suffix.lower() == '.py':
         print(f"⚠️  Warning: Output file doesn't have .py extension: {output_path}")
     
+    # Skip generation when neither the mermaid file nor the output changed
+    cache_file = output_path.parent / ".task_gen_cache.json"
+    if is_output_current(input_path, output_path, cache_file):
+        print(f"✅ {output_path} is up to date with {input_path} (unchanged)")
+        return
+    
     # Generate tasks
     print(f"🚀 Generating tasks file...")
     print(f"   Input:  {input_path}")
     print(f"   Output: {output_path}")
     
-    tasks_content = generate_full_tasks(args.input)
+    tasks_content = generate_full_tasks(args.input, cache_file)
     
     if tasks_content:
-        # Write to output file
+        # Write to output file, leaving its mtime alone when the content is the same
         try:
-            output_path.write_text(tasks_content)
+            new_bytes = tasks_content.encode('utf-8')
+            if output_path.exists() and output_path.read_bytes() == new_bytes:
+                print(f"✅ {output_path} content unchanged, not rewritten")
+                return
+            output_path.write_bytes(new_bytes)
             print(f"✅ Successfully generated: {output_path}")
             print(f"📊 File size: {len(tasks_content):,} characters")
             
@@ -5,9 +5,16 @@ Minimal Mermaid Utils - Parse .mmd files and generate Invoke tasks
 
 VERSION = "4.0.0"
 
+import hashlib
+import json
+import logging
+import os
 import textwrap
 import sys
+from dataclasses import dataclass
+from functools import lru_cache
 from pathlib import Path
+from types import MappingProxyType
 from antlr4 import *
 
 # Import generated ANTLR classes
@@ -26,159 +33,204 @@ except ImportError as e:
     print("   - MermaidPipelineParserListener.py")
     sys.exit(1)
 
+# Parse warnings (malformed node declarations)
+log = logging.getLogger('mermaid_utils')
+
+# =============================================================================
+# PARSED NODES
+# =============================================================================
+
+@dataclass(frozen=True, slots=True)
+class MermaidNode:
+    """A mermaid node: id, type (first letter of the id), main content and description."""
+    id: str
+    type: str
+    content: str
+    description: str
+
 # =============================================================================
 # ANTLR LISTENER WITH LEXER MODE SUPPORT
 # =============================================================================
 
+# First letters of pipeline node IDs: Input, Task, Output, Runnable, Export
+_NODE_PREFIXES = frozenset('ITORE')
+
+# Node shape by the token that opens it
+_SHAPE_TYPES = {
+    MermaidPipelineParser.LSQUARE: "square",
+    MermaidPipelineParser.LPAREN: "round",
+    MermaidPipelineParser.LBRACE: "diamond",
+}
+
+def _rule_text(tree):
+    """
+    Text of a parse tree node. Single-token rules (ids, node content) read
+    the token's text, a slice of the input, instead of walking the subtree
+    and concatenating child strings.
+    """
+    if isinstance(tree, ParserRuleContext) and tree.start is tree.stop:
+        return tree.start.text
+    return tree.getText()
+
 class MermaidDisplayListener(MermaidPipelineParserListener):
     """ANTLR listener that extracts mermaid content with proper whitespace preservation."""
     
     def __init__(self):
         self.nodes = []
+        self.nodes_by_id = {}    # node_id -> node (first declaration wins)
+        self.nodes_by_type = {}  # 'I'/'T'/'R'/'O'/'E' -> [node, ...] in declaration order
         self.edges = []
+        self.successors = {}    # node_id -> [node_id, ...] in edge order
+        self.predecessors = {}  # node_id -> [node_id, ...] in edge order
+        self.ids_by_type = {}   # type (first letter) -> {node_id, ...}, declared or used in edges
         self.class_defs = []
         self.class_assignments = []
         self.graph_direction = None
         self.init_content = None
+        self.char_count = 0     # size of the parsed source, in characters
     
-    def enterGraphDeclaration(self, ctx):
+    def _add_node(self, node):
+        """Record a node and index it by id and type."""
+        self.nodes.append(node)
+        self.nodes_by_id.setdefault(node.id, node)
+        self.nodes_by_type.setdefault(node.type, []).append(node)
+        self.ids_by_type.setdefault(node.type, set()).add(node.id)
+    
+    def _add_edge(self, from_node, to_node):
+        """Record an edge and index it by both endpoints."""
+        self.edges.append((from_node, to_node))
+        self.successors.setdefault(from_node, []).append(to_node)
+        self.predecessors.setdefault(to_node, []).append(from_node)
+        self.ids_by_type.setdefault(from_node[:1], set()).add(from_node)
+        self.ids_by_type.setdefault(to_node[:1], set()).add(to_node)
+    
+    def to_state(self):
+        """Return the parsed content as JSON-serializable data (see from_state)."""
+        return {
+            'nodes': [[node.id, node.type, node.content, node.description] for node in self.nodes],
+            'edges': self.edges,
+            'class_defs': self.class_defs,
+            'class_assignments': self.class_assignments,
+            'graph_direction': self.graph_direction,
+            'init_content': self.init_content,
+            'char_count': self.char_count,
+        }
+    
+    @classmethod
+    def from_state(cls, state):
+        """Rebuild a populated listener (and its indices) from to_state() data."""
+        listener = cls()
+        for fields in state['nodes']:
+            listener._add_node(MermaidNode(*fields))
+        for from_node, to_node in state['edges']:
+            listener._add_edge(from_node, to_node)
+        listener.class_defs = [tuple(class_def) for class_def in state['class_defs']]
+        listener.class_assignments = [tuple(assignment) for assignment in state['class_assignments']]
+        listener.graph_direction = state['graph_direction']
+        listener.init_content = state['init_content']
+        listener.char_count = state['char_count']
+        return listener
+    
+    def exitGraphDeclaration(self, ctx):
         """Extract graph direction."""
-        try:
-            if hasattr(ctx, 'direction') and ctx.direction():
-                self.graph_direction = ctx.direction().getText()
-        except Exception as e:
-            print(f"⚠️ Warning in enterGraphDeclaration: {e}")
+        direction = ctx.direction()
+        if direction is not None:
+            self.graph_direction = _rule_text(direction)
     
-    def enterInitBlock(self, ctx):
+    def exitInitBlock(self, ctx):
         """Extract init block content."""
-        try:
-            if hasattr(ctx, 'initContent') and ctx.initContent():
-                self.init_content = ctx.initContent().getText()
-        except Exception as e:
-            print(f"⚠️ Warning in enterInitBlock: {e}")
+        init_content = ctx.initContent()
+        if init_content is not None:
+            self.init_content = _rule_text(init_content)
     
-    def enterNodeDeclaration(self, ctx):
+    def exitNodeDeclaration(self, ctx):
         """Extract node declarations with preserved whitespace from lexer modes."""
-        try:
-            # Get node ID
-            node_id = None
-            if hasattr(ctx, 'nodeId') and ctx.nodeId():
-                node_id = ctx.nodeId().getText()
-            else:
-                print(f"⚠️ No nodeId found")
-                return
-            
-            # Get node content from the shape (brackets, parens, braces)
-            content = ""
-            shape_type = "none"
-            
-            if hasattr(ctx, 'nodeShape') and ctx.nodeShape():
-                shape_ctx = ctx.nodeShape()
+        # Get node ID
+        id_ctx = ctx.nodeId()
+        if id_ctx is None:
+            log.warning("⚠️ No nodeId found")
+            return
+        node_id = _rule_text(id_ctx)
+        
+        # Get node content from the shape (brackets, parens, braces)
+        content = ""
+        shape_type = "none"
+        
+        shape_ctx = ctx.nodeShape()
+        if shape_ctx is not None:
+            # The content should be available via nodeContent()
+            content_ctx = shape_ctx.nodeContent()
+            if content_ctx is not None:
+                content = _rule_text(content_ctx)  # Token text keeps the whitespace
                 
-                # The content should be available via nodeContent()
-                if hasattr(shape_ctx, 'nodeContent') and shape_ctx.nodeContent():
-                    content_ctx = shape_ctx.nodeContent()
-                    content = content_ctx.getText()  # This should now preserve whitespace!
-                    
-                    # Detect shape type from the shape context
-                    if hasattr(shape_ctx, 'LSQUARE') and shape_ctx.LSQUARE():
-                        shape_type = "square"
-                    elif hasattr(shape_ctx, 'LPAREN') and shape_ctx.LPAREN():
-                        shape_type = "round"  
-                    elif hasattr(shape_ctx, 'LBRACE') and shape_ctx.LBRACE():
-                        shape_type = "diamond"
-                else:
-                    print("⚠️ No nodeContent found in nodeShape")
-            else:
-                # Node without explicit shape - just the ID
-                content = node_id
-            
-            # Split content by <br/> if present
-            if '<br/>' in content:
-                parts = content.split('<br/>')
-                main_content = parts[0].strip()
-                description = parts[1].strip() if len(parts) > 1 else ""
+                # Detect shape type from the shape's opening token
+                shape_type = _SHAPE_TYPES.get(shape_ctx.start.type, shape_type)
             else:
-                main_content = content.strip()
-                description = ""
-            
-            self.nodes.append({
-                'id': node_id,
-                'type': node_id[0] if node_id else 'U',
-                'content': main_content,
-                'description': description
-            })
-            
-        except Exception as e:
-            print(f"❌ Error processing node {ctx.getText()}: {e}")
-            import traceback
-            traceback.print_exc()
+                log.warning("⚠️ No nodeContent found in nodeShape")
+        else:
+            # Node without explicit shape - just the ID
+            content = node_id
+        
+        # Split content by <br/> if present (main content, then description)
+        head, _, tail = content.partition('<br/>')
+        main_content = head.strip()
+        description = tail.partition('<br/>')[0].strip()
+        
+        node = MermaidNode(
+            id=node_id,
+            type=node_id[0] if node_id else 'U',
+            content=main_content,
+            description=description
+        )
+        self._add_node(node)
     
-    def enterEdge(self, ctx):
+    def exitEdge(self, ctx):
         """Extract edge relationships."""
-        try:
-            if hasattr(ctx, 'nodeId'):
-                # Get the two node IDs
-                node_ids = []
-                for i in range(ctx.getChildCount()):
-                    child = ctx.getChild(i)
-                    if hasattr(child, 'getText'):
-                        child_text = child.getText()
-                        # Check if this looks like a node ID
-                        if len(child_text) > 0 and child_text[0] in 'ITORE':
-                            node_ids.append(child_text)
-                
-                if len(node_ids) >= 2:
-                    from_node = node_ids[0]
-                    to_node = node_ids[1]
-                    self.edges.append((from_node, to_node))
-                
-        except Exception as e:
-            print(f"❌ Error processing edge: {e}")
+        # Get the two node IDs (edge: nodeId edgeType nodeId)
+        node_ids = [_rule_text(id_ctx) for id_ctx in ctx.nodeId()]
+        # Only pipeline node IDs (I/T/O/R/E) form edges
+        node_ids = [node_id for node_id in node_ids if node_id[:1] in _NODE_PREFIXES]
+        
+        if len(node_ids) >= 2:
+            self._add_edge(node_ids[0], node_ids[1])
     
-    def enterClassDef(self, ctx):
+    def exitClassDef(self, ctx):
         """Extract classDef statements."""
-        try:
-            class_name = ""
-            properties = ""
-            
-            if hasattr(ctx, 'IDENTIFIER') and ctx.IDENTIFIER():
-                class_name = ctx.IDENTIFIER().getText()
-            
-            if hasattr(ctx, 'cssContent') and ctx.cssContent():
-                properties = ctx.cssContent().getText()
-            
-            if class_name:
-                self.class_defs.append((class_name, properties))
-                
-        except Exception as e:
-            print(f"❌ Error processing classDef: {e}")
+        class_name = ""
+        properties = ""
+        
+        identifier = ctx.IDENTIFIER()
+        if identifier is not None:
+            class_name = identifier.getText()
+        
+        css_content = ctx.cssContent()
+        if css_content is not None:
+            properties = _rule_text(css_content)
+        
+        if class_name:
+            self.class_defs.append((class_name, properties))
     
-    def enterClassAssignment(self, ctx):
+    def exitClassAssignment(self, ctx):
         """Extract class assignments."""
-        try:
-            class_name = ""
-            nodes = []
-            
-            if hasattr(ctx, 'classNodeList') and ctx.classNodeList():
-                node_list = ctx.classNodeList()
-                # Get all node IDs from the list
-                for child in node_list.getChildren():
-                    if hasattr(child, 'getText') and child.getText() not in [',']:
-                        text = child.getText()
-                        if len(text) > 0 and text[0] in 'ITORE':
-                            nodes.append(text)
-            
-            if hasattr(ctx, 'IDENTIFIER') and ctx.IDENTIFIER():
-                class_name = ctx.IDENTIFIER().getText()
-            
-            if class_name and nodes:
-                self.class_assignments.append((nodes, class_name))
-                
-        except Exception as e:
-            print(f"❌ Error processing class assignment: {e}")
+        class_name = ""
+        nodes = []
+        
+        node_list = ctx.classNodeList()
+        if node_list is not None:
+            # Get all pipeline node IDs from the list
+            for id_ctx in node_list.nodeId():
+                text = _rule_text(id_ctx)
+                if text[:1] in _NODE_PREFIXES:
+                    nodes.append(text)
+        
+        identifier = ctx.IDENTIFIER()
+        if identifier is not None:
+            class_name = identifier.getText()
+        
+        if class_name and nodes:
+            self.class_assignments.append((nodes, class_name))
     
-    def enterComment(self, ctx):
+    def exitComment(self, ctx):
         """Handle comments (mostly ignore but could log)."""
         pass
 
@@ -186,6 +238,109 @@ class MermaidDisplayListener(MermaidPipelineParserListener):
 # PARSER FUNCTIONS
 # =============================================================================
 
+# Lexer/parser pair reused across parses so the ATN simulators (and their
+# prediction context caches) are built once per process
+_LEXER = None
+_PARSER = None
+
+def _reset_parser(input_stream):
+    """Point the shared lexer/parser at a new input and return the parser."""
+    global _LEXER, _PARSER
+    if _PARSER is None:
+        _LEXER = MermaidPipelineLexer(input_stream)
+        _LEXER.removeErrorListeners()
+        _PARSER = MermaidPipelineParser(CommonTokenStream(_LEXER))
+        _PARSER.removeErrorListeners()
+    else:
+        _LEXER.inputStream = input_stream
+        _PARSER.setTokenStream(CommonTokenStream(_LEXER))
+    return _PARSER
+
+# Parse results are only valid for the listener and generated parser that produced them
+_PARSER_HASH = hashlib.blake2b(
+    Path(__file__).read_bytes() + Path(sys.modules[MermaidPipelineParser.__module__].__file__).read_bytes(),
+    digest_size=16
+).hexdigest()
+
+def _parse_cache_path(mermaid_path):
+    """On-disk parse cache next to the mermaid file (e.g. .tasks.mmd.parse_cache.json)."""
+    path = Path(mermaid_path)
+    return path.with_name(f".{path.name}.parse_cache.json")
+
+def _parse_content(content):
+    """
+    Run the ANTLR parser over mermaid source and return the populated listener.
+    
+    The shared parser feeds the listener while it runs (exit events fire as
+    each rule completes), instead of walking a finished parse tree afterwards.
+    The parse tree is still built: the exit hooks read their child contexts
+    (nodeId(), nodeShape(), ...). It is dropped with the parser's context
+    once diagram() returns; only the listener is kept.
+    
+    A single parse with full LL prediction and the default (recovering) error
+    strategy: the init line of tasks.mmd does not match the grammar, so an
+    SLL attempt that bails out on the first error would always parse twice.
+    """
+    listener = MermaidDisplayListener()
+    parser = _reset_parser(InputStream(content))
+    parser.addParseListener(listener)
+    try:
+        parser.diagram()
+    finally:
+        parser.removeParseListeners()
+    listener.char_count = len(content)
+    return listener
+
+@lru_cache(maxsize=None)
+def _load_listener(mermaid_path, file_version):
+    """
+    Parse a mermaid file with ANTLR and return the populated listener.
+    Cached on (path, (mtime_ns, size)) so every helper in a process shares
+    one parse until the file changes on disk. Across processes, the result
+    is also cached on disk keyed by a hash of the file content, so a new
+    run on an unchanged diagram skips ANTLR entirely.
+    """
+    content = Path(mermaid_path).read_text()
+    digest = hashlib.blake2b((_PARSER_HASH + content).encode(), digest_size=16).hexdigest()
+    cache_path = _parse_cache_path(mermaid_path)
+    
+    try:
+        cached = json.loads(cache_path.read_text())
+        if cached.get('digest') == digest:
+            return MermaidDisplayListener.from_state(cached['state'])
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+    
+    listener = _parse_content(content)
+    
+    try:
+        tmp_path = cache_path.with_name(cache_path.name + '.tmp')
+        tmp_path.write_text(json.dumps({'digest': digest, 'state': listener.to_state()}))
+        os.replace(tmp_path, cache_path)
+    except OSError:
+        pass  # read-only checkout: parse again next run
+    
+    return listener
+
+def load_mermaid(mermaid_file):
+    """
+    Parse a mermaid file, reusing the cached result while the file is unchanged.
+    The returned listener is shared between callers and must not be modified.
+    """
+    mermaid_path = str(Path(mermaid_file).resolve())
+    stat = os.stat(mermaid_path)
+    return _load_listener(mermaid_path, (stat.st_mtime_ns, stat.st_size))
+
+def _forget_parses():
+    """
+    Drop every in-process parse and the file-node categories derived from it
+    (the on-disk cache is keyed by content and stays valid).
+    """
+    _load_listener.cache_clear()
+    _categorize_file_nodes.cache_clear()
+
+load_mermaid.cache_clear = _forget_parses
+
 def parse_and_display_mermaid(mermaid_file: str):
     """Parse mermaid file and display its contents using ANTLR."""
     print(f"🚀 Mermaid Utils v{VERSION}")
@@ -198,30 +353,10 @@ def parse_and_display_mermaid(mermaid_file: str):
         return
     
     try:
-        # Read and parse with ANTLR
-        content = mermaid_path.read_text()
-        print(f"📏 File size: {len(content)} characters")
-        
-        # Create ANTLR input stream
-        input_stream = InputStream(content)
-        lexer = MermaidPipelineLexer(input_stream)
-        
-        # Set up error handling
-        lexer.removeErrorListeners()
-        
-        stream = CommonTokenStream(lexer)
-        parser = MermaidPipelineParser(stream)
-        
-        # Remove default error listeners to avoid spam
-        parser.removeErrorListeners()
-        
-        # Parse the content
-        tree = parser.diagram()
-        
-        # Extract information using listener
-        listener = MermaidDisplayListener()
-        walker = ParseTreeWalker()
-        walker.walk(listener, tree)
+        # Extract information using the cached ANTLR parse (the file is read
+        # once; its size is recorded on the listener)
+        listener = load_mermaid(mermaid_path)
+        print(f"📏 File size: {listener.char_count} characters")
         
         # Display results
         display_full_parsed_content(listener)
@@ -247,23 +382,23 @@ def display_full_parsed_content(listener):
     node_types = {'I': 'Inputs', 'T': 'Tasks', 'O': 'Outputs', 'R': 'Runnables', 'E': 'Exports'}
     
     for node_type, type_name in node_types.items():
-        type_nodes = [n for n in listener.nodes if n['type'] == node_type]
+        type_nodes = listener.nodes_by_type.get(node_type, [])
         if type_nodes:
             print(f"\n📋 {type_name}:")
             for node in type_nodes:
-                print(f"   {node['id']}: {node['content']}")
-                if node['description']:
-                    print(f"      └─ {node['description']}")
+                print(f"   {node.id}: {node.content}")
+                if node.description:
+                    print(f"      └─ {node.description}")
                 
                 # Add input/output info for Tasks and Runnables
                 if node_type in ['T', 'R']:
                     # Show inputs (what flows into this node)
-                    inputs = [from_node for from_node, to_node in listener.edges if to_node == node['id']]
+                    inputs = listener.predecessors.get(node.id, [])
                     if inputs:
                         print(f"      📥 Inputs: {', '.join(inputs)}")
                     
                     # Show outputs (what flows out of this node)  
-                    outputs = [to_node for from_node, to_node in listener.edges if from_node == node['id']]
+                    outputs = listener.successors.get(node.id, [])
                     if outputs:
                         print(f"      📤 Outputs: {', '.join(outputs)}")
     
@@ -292,7 +427,7 @@ def display_full_parsed_content(listener):
     print(f"   Style definitions: {len(listener.class_defs)}")
     print(f"   Style assignments: {len(listener.class_assignments)}")
     for node_type, type_name in node_types.items():
-        count = len([n for n in listener.nodes if n['type'] == node_type])
+        count = len(listener.nodes_by_type.get(node_type, []))
         if count > 0:
             print(f"   {type_name}: {count}")
 
@@ -300,6 +435,34 @@ def display_full_parsed_content(listener):
 # MERMAID FILE ANALYSIS HELPERS
 # =============================================================================
 
+# Shared read-only result for a missing or unparsable mermaid file
+_EMPTY_FILE_INFO = MappingProxyType({'inputs': (), 'outputs': (), 'exports': ()})
+
+@lru_cache(maxsize=None)
+def _categorize_file_nodes(listener):
+    """
+    Categorize a parsed diagram's file nodes once per listener (load_mermaid
+    hands out the same listener until the file changes), so the status,
+    clean and target helpers share one pass. Read-only like _EMPTY_FILE_INFO.
+    """
+    file_info = {
+        'inputs': [],
+        'outputs': [], 
+        'exports': []
+    }
+    
+    for category, node_type in (('inputs', 'I'), ('outputs', 'O'), ('exports', 'E')):
+        for node in listener.nodes_by_type.get(node_type, []):
+            filename = node.content.replace('BWV000', '{PROJECT_NAME}')
+            file_info[category].append(MappingProxyType({
+                'id': node.id,
+                'filename': filename,
+                'description': node.description,
+                'category': node.type
+            }))
+    
+    return MappingProxyType({category: tuple(entries) for category, entries in file_info.items()})
+
 def get_all_file_nodes(mermaid_file):
     """
     Parse mermaid file and return all file-related nodes (I, O, E).
@@ -307,52 +470,13 @@ def get_all_file_nodes(mermaid_file):
     """
     mermaid_path = Path(mermaid_file)
     if not mermaid_path.exists():
-        return {}
+        return _EMPTY_FILE_INFO
     
     try:
-        content = mermaid_path.read_text()
-        input_stream = InputStream(content)
-        lexer = MermaidPipelineLexer(input_stream)
-        lexer.removeErrorListeners()
-        
-        stream = CommonTokenStream(lexer)
-        parser = MermaidPipelineParser(stream)
-        parser.removeErrorListeners()
-        
-        tree = parser.diagram()
-        
-        listener = MermaidDisplayListener()
-        walker = ParseTreeWalker()
-        walker.walk(listener, tree)
-        
-        # Categorize file nodes
-        file_info = {
-            'inputs': [],
-            'outputs': [], 
-            'exports': []
-        }
-        
-        for node in listener.nodes:
-            filename = node['content'].replace('BWV000', '{PROJECT_NAME}')
-            file_data = {
-                'id': node['id'],
-                'filename': filename,
-                'description': node.get('description', ''),
-                'category': node['type']
-            }
-            
-            if node['type'] == 'I':
-                file_info['inputs'].append(file_data)
-            elif node['type'] == 'O':
-                file_info['outputs'].append(file_data)
-            elif node['type'] == 'E':
-                file_info['exports'].append(file_data)
-        
-        return file_info
-        
+        return _categorize_file_nodes(load_mermaid(mermaid_path))
     except Exception as e:
         print(f"❌ Error parsing mermaid file: {e}")
-        return {}
+        return _EMPTY_FILE_INFO
 
 def get_all_target_files(mermaid_file):
     """
@@ -380,47 +504,34 @@ def get_final_tasks(mermaid_file):
         return []
     
     try:
-        content = mermaid_path.read_text()
-        input_stream = InputStream(content)
-        lexer = MermaidPipelineLexer(input_stream)
-        lexer.removeErrorListeners()
-        
-        stream = CommonTokenStream(lexer)
-        parser = MermaidPipelineParser(stream)
-        parser.removeErrorListeners()
-        
-        tree = parser.diagram()
-        
-        listener = MermaidDisplayListener()
-        walker = ParseTreeWalker()
-        walker.walk(listener, tree)
+        listener = load_mermaid(mermaid_path)
         
         final_tasks = []
         
         # Find all export nodes (E*)
-        export_nodes = [node['id'] for node in listener.nodes if node['type'] == 'E']
+        export_nodes = [node.id for node in listener.nodes_by_type.get('E', [])]
         
         # For each export, trace back to find the task that produces it
         for export_id in export_nodes:
             # Find runnable that produces this export (R -> E)
             producing_runnable = None
-            for from_node, to_node in listener.edges:
-                if to_node == export_id and from_node.startswith('R'):
+            for from_node in listener.predecessors.get(export_id, []):
+                if from_node in listener.ids_by_type.get('R', ()):
                     producing_runnable = from_node
                     break
             
             if producing_runnable:
                 # Find task that produces this runnable (T -> R)
-                for from_node, to_node in listener.edges:
-                    if to_node == producing_runnable and from_node.startswith('T'):
+                for from_node in listener.predecessors.get(producing_runnable, []):
+                    if from_node in listener.ids_by_type.get('T', ()):
                         # Get node by ID
-                        task_node = next((n for n in listener.nodes if n['id'] == from_node), None)
+                        task_node = listener.nodes_by_id.get(from_node)
                         if task_node:
-                            final_tasks.append(task_node['content'])
+                            final_tasks.append(task_node.content)
                         break
         
         # Remove duplicates and return
-        return list(set(final_tasks))
+        return list(dict.fromkeys(final_tasks))
         
     except Exception as e:
         print(f"❌ Error parsing mermaid file for final tasks: {e}")
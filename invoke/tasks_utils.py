@@ -8,22 +8,33 @@ Usage from any BWV project:
 
 import builtins
 import hashlib
-import inspect
 import json
 import os
 import re
 import sys
 import subprocess
+import threading
+import time
 from collections import defaultdict
 from datetime import datetime
+from functools import lru_cache
 from invoke import task
+from operator import itemgetter
 from pathlib import Path
 
+# Location of this file (the invoke dir), resolved once
+TASKS_DIR = Path(__file__).parent
+SCRIPTS_DIR = TASKS_DIR.parent / 'python'
+
+# LilyPond \include "file" directives
+_INCLUDE_RE = re.compile(r'\\include\s+"([^"]+)"')
+
 # =============================================================================
 # git project detection
 # =============================================================================
 
 
+@lru_cache(maxsize=None)
 def detect_project_name():
     """Detect project name from git repository root directory, fallback to current directory."""
     project_name = None
@@ -83,7 +94,7 @@ def get_shared_ly_sources_tree(project_name=None):
         
         try:
             content = file_path.read_text(encoding='utf-8')
-            includes = re.findall(r'\\include\s+"([^"]+)"', content)
+            includes = _INCLUDE_RE.findall(content)
             
             for include_file in includes:
                 include_path = Path(include_file)
@@ -110,22 +121,38 @@ def flatten_tree(tree_dict):
     """
     Flatten a dependency tree into a list of unique Path objects.
     
+    Walks the tree iteratively with a visited set, so files included from
+    several places (diamond includes) are visited once.
+    
     Args:
         tree_dict: Dictionary representing tree structure {parent: [children]}
         
     Returns:
-        list: All unique Path objects from the tree
+        list: All unique Path objects from the tree, in depth-first order
     """
-    all_paths = set()
-    
-    # Add all parent files
-    all_paths.update(tree_dict.keys())
-    
-    # Add all child files
-    for children in tree_dict.values():
-        all_paths.update(children)
+    seen = set()
+    all_paths = []
+    stack = list(reversed(tree_dict.keys()))
+    
+    while stack:
+        node = stack.pop()
+        if node in seen:
+            continue
+        seen.add(node)
+        all_paths.append(node)
+        stack.extend(reversed(tree_dict.get(node, [])))
+    
+    return all_paths
+
+@lru_cache(maxsize=None)
+def get_shared_ly_sources(project_name=None):
+    """
+    Shared LilyPond sources of a project, scanned once per pipeline run.
     
-    return list(all_paths)    
+    run_task_graph clears this cache when it starts, so a long-lived process
+    (or a second run in the same process) picks up edited \\include lines.
+    """
+    return tuple(Path(p) for p in flatten_tree(get_shared_ly_sources_tree(project_name)))
 
 
 # ==============================================================================
@@ -188,8 +215,8 @@ def gentle_exit(message, exit_code=1):
 # ==============================================================================
 
 def hash_file(path):
-    """Compute SHA256 hash of a file for change detection."""
-    hasher = hashlib.sha256()
+    """Compute BLAKE2b hash of a file for change detection."""
+    hasher = hashlib.blake2b()
     with open(path, "rb") as f:
         while chunk := f.read(8192):
             hasher.update(chunk)
@@ -207,6 +234,37 @@ def save_cache(cache, cache_file=".build_cache.json"):
     cache_path = Path(cache_file)
     cache_path.write_text(json.dumps(cache, indent=2))
 
+# Cache key holding [mtime_ns, size, hash] of every source file seen
+FILE_STATS_KEY = "_file_stats"
+
+# Serializes read-modify-write of the cache file when tasks run in parallel
+_CACHE_LOCK = threading.Lock()
+
+# Per-run stat() results {Path: os.stat_result or None}: sources shared by
+# many tasks (e.g. the LilyPond includes) are only stat()ed once per run.
+# smart_task forgets a task's targets whenever it rebuilds them, and
+# run_task_graph starts every run with an empty cache.
+_STAT_CACHE = {}
+
+def cached_stat(path):
+    """Stat a file once per run; None if it does not exist."""
+    path = Path(path)
+    try:
+        return _STAT_CACHE[path]
+    except KeyError:
+        pass
+    try:
+        st = path.stat()
+    except OSError:
+        st = None
+    _STAT_CACHE[path] = st
+    return st
+
+def forget_stats(paths):
+    """Drop cached stat() results of files that are about to change."""
+    for path in paths:
+        _STAT_CACHE.pop(Path(path), None)
+
 def sources_changed(task_name, source_paths, cache_file=".build_cache.json"):
     """
     Check if any input file changed since last build.
@@ -219,15 +277,50 @@ def sources_changed(task_name, source_paths, cache_file=".build_cache.json"):
     Returns:
         bool: True if any source file changed
     """
-    cache = load_cache(cache_file)
-    current_hashes = {str(p): hash_file(p) for p in source_paths if p.exists()}
-    cached_hashes = cache.get(task_name, {})
-    changed = current_hashes != cached_hashes
-    if changed:
-        cache[task_name] = current_hashes
-        save_cache(cache, cache_file)
+    with _CACHE_LOCK:
+        file_stats = load_cache(cache_file).get(FILE_STATS_KEY, {})
+    
+    # Only rehash files whose (mtime, size) differ from the last recorded stat
+    current_hashes = {}
+    new_stats = {}
+    for p in source_paths:
+        st = cached_stat(p)
+        if st is None:
+            continue
+        key = str(p)
+        entry = file_stats.get(key)
+        if entry and entry[0] == st.st_mtime_ns and entry[1] == st.st_size:
+            current_hashes[key] = entry[2]
+        else:
+            current_hashes[key] = hash_file(p)
+            new_stats[key] = [st.st_mtime_ns, st.st_size, current_hashes[key]]
+    
+    with _CACHE_LOCK:
+        cache = load_cache(cache_file)
+        cached_hashes = cache.get(task_name, {})
+        changed = current_hashes != cached_hashes
+        if changed:
+            cache[task_name] = current_hashes
+        if new_stats:
+            cache.setdefault(FILE_STATS_KEY, {}).update(new_stats)
+        if changed or new_stats:
+            save_cache(cache, cache_file)
     return changed
 
+# Cache key holding the last build duration of each task (seconds)
+DURATIONS_KEY = "_durations"
+
+def record_task_duration(task_name, seconds, cache_file=".build_cache.json"):
+    """Store the wall-clock time of the last build of a task in the cache."""
+    with _CACHE_LOCK:
+        cache = load_cache(cache_file)
+        cache.setdefault(DURATIONS_KEY, {})[task_name] = round(seconds, 3)
+        save_cache(cache, cache_file)
+
+def load_task_durations(cache_file=".build_cache.json"):
+    """Load the last recorded build duration of each task: {task_name: seconds}."""
+    return load_cache(cache_file).get(DURATIONS_KEY, {})
+
 # ==============================================================================
 # FILE MANAGEMENT UTILITIES
 # ==============================================================================
@@ -243,9 +336,11 @@ def remove_outputs(*filenames, force=True):
     deleted = []
     for name in filenames:
         path = Path(name)
-        if path.exists():
+        try:
             path.unlink()
-            deleted.append(path.name)
+        except FileNotFoundError:
+            continue
+        deleted.append(path.name)
 
     print("🗑️ Deleted:", end="")
     if deleted:
@@ -266,19 +361,88 @@ def get_file_info(filename, name):
     Returns:
         tuple: (mtime, name, filename, size, exists)
     """
-    path = Path(filename)
-    if path.exists():
-        mtime = path.stat().st_mtime
-        size = path.stat().st_size
-        return (mtime, name, filename, size, True)
-    else:
+    # One stat() call answers both "does it exist" and "what are mtime/size"
+    try:
+        stat = os.stat(filename)
+    except FileNotFoundError:
         return (0, name, filename, 0, False)  # Missing files sort first
+    return (stat.st_mtime, name, filename, stat.st_size, True)
+
+def stat_batch(paths):
+    """
+    Stat many files with a single os.scandir() pass per parent directory.
+    
+    Missing files are resolved from the directory listing without a failed
+    stat() call each.
+    
+    Args:
+        paths: Iterable of file paths
+        
+    Returns:
+        dict: {Path: os.stat_result} for the paths that exist
+    """
+    by_parent = defaultdict(list)
+    for path in paths:
+        path = Path(path)
+        by_parent[path.parent].append(path)
+    
+    stats = {}
+    for parent, children in by_parent.items():
+        try:
+            with os.scandir(parent) as entries:
+                entries_by_name = {entry.name: entry for entry in entries}
+        except (FileNotFoundError, NotADirectoryError):
+            continue  # Whole directory missing - none of its files exist
+        
+        for child in children:
+            entry = entries_by_name.get(child.name)
+            if entry is not None:
+                stats[child] = entry.stat()
+    
+    return stats
+
+def get_file_infos(files):
+    """
+    Get file information for many files at once (see get_file_info).
+    
+    Args:
+        files: List of (filename, display_name) tuples
+        
+    Returns:
+        list: (mtime, name, filename, size, exists) tuples in input order
+    """
+    files = list(files)
+    stats = stat_batch(filename for filename, _ in files)
+    
+    file_infos = []
+    for filename, name in files:
+        stat = stats.get(Path(filename))
+        if stat is not None:
+            file_infos.append((stat.st_mtime, name, filename, stat.st_size, True))
+        else:
+            file_infos.append((0, name, filename, 0, False))  # Missing files sort first
+    return file_infos
 
 # ==============================================================================
 # SMART TASK RUNNER
 # ==============================================================================
 
-def smart_task(c, *, sources, targets, commands=None, python_func=None, force=False, cache_file=".build_cache.json"):
+def run_shell_command(c, task_name, cmd):
+    """Run one shell command of a task, exiting gently on failure."""
+    # Run subprocess commands with unbuffered output for better logging
+    if cmd.startswith('python3 '):
+        cmd = cmd.replace('python3 ', 'python3 -u ')
+    # Reuse the persistent LilyPond container when it is up
+    cmd = lily_exec(cmd)
+    print("##############")
+    print(f"{cmd}")
+    
+    try:
+        c.run(cmd)
+    except Exception as e:
+        gentle_exit(f"Command failed in task '{task_name}': {cmd}")
+
+def smart_task(c, *, sources, targets, commands=None, python_func=None, force=False, cache_file=".build_cache.json", task_name=None):
     """
     Unified smart task runner with caching and progress reporting.
     
@@ -290,6 +454,8 @@ def smart_task(c, *, sources, targets, commands=None, python_func=None, force=Fa
         python_func: Python function to execute (optional if commands provided)
         force: If True, force rebuild regardless of cache
         cache_file: Path to cache file
+        task_name: Name used for logging and the cache key (defaults to the
+                   calling function's name)
     """
     # Validate that exactly one of commands or python_func is provided
     if commands and python_func:
@@ -297,27 +463,21 @@ def smart_task(c, *, sources, targets, commands=None, python_func=None, force=Fa
     if not commands and not python_func:
         gentle_exit("Internal error: Must specify either 'commands' or 'python_func'")
     
-    task_name = inspect.stack()[1].function
+    if task_name is None:
+        task_name = sys._getframe(1).f_code.co_name
     print(f"")
     print(f"[{task_name}] ↓   ↓   ↓   ↓   ↓   ↓   ↓   ↓")
     
     if force or sources_changed(task_name, sources, cache_file):
+        forget_stats(targets)
         remove_outputs(*targets)
         print(f"🔄 Rebuilding {task_name}...")
+        started = time.perf_counter()
         
         if commands:
             # Execute shell commands
             for cmd in commands:
-                # Run subprocess commands with unbuffered output for better logging
-                if cmd.startswith('python3 '):
-                    cmd = cmd.replace('python3 ', 'python3 -u ')
-                print("##############")
-                print(f"{cmd}")
-                
-                try:
-                    c.run(cmd)
-                except Exception as e:
-                    gentle_exit(f"Command failed in task '{task_name}': {cmd}")
+                run_shell_command(c, task_name, cmd)
         
         elif python_func:
             # Execute Python function with gentle error handling
@@ -336,6 +496,9 @@ def smart_task(c, *, sources, targets, commands=None, python_func=None, force=Fa
                 else:
                     gentle_exit(f"Task '{task_name}' failed: {error_msg}")
         
+        record_task_duration(task_name, time.perf_counter() - started, cache_file)
+        forget_stats(targets)  # Rewritten by the commands above
+        
         # Validate that all targets were actually created
         missing_targets = [t for t in targets if not Path(t).exists()]
         if missing_targets:
@@ -356,13 +519,14 @@ def smart_task(c, *, sources, targets, commands=None, python_func=None, force=Fa
         
 def print_file_status(file_path, description):
     """Print formatted file status information."""
-    if file_path.exists():
+    try:
         stat = file_path.stat()
-        size = stat.st_size
-        mtime = datetime.fromtimestamp(stat.st_mtime).strftime('%Y-%m-%d %H:%M:%S')
-        print(f"   ✅ {description:<15}: {file_path} ({size:,} bytes, {mtime})")
-    else:
+    except FileNotFoundError:
         print(f"   ❌ {description:<15}: {file_path} (missing)")
+        return
+    size = stat.st_size
+    mtime = datetime.fromtimestamp(stat.st_mtime).strftime('%Y-%m-%d %H:%M:%S')
+    print(f"   ✅ {description:<15}: {file_path} ({size:,} bytes, {mtime})")
 
 def print_build_status(files):
     """
@@ -372,16 +536,18 @@ def print_build_status(files):
         files: List of (filename, display_name) tuples
     """
     # Get file info and sort by timestamp
-    file_infos = [get_file_info(filename, name) for filename, name in files]
-    file_infos.sort(key=lambda x: x[0])  # Sort by mtime
+    file_infos = get_file_infos(files)
+    file_infos.sort(key=itemgetter(0))  # Sort by mtime
     
-    print("📊 Build Status:")
+    # Build the whole report first and print it in one write
+    lines = ["📊 Build Status:"]
     for mtime, name, filename, size, exists in file_infos:
         if exists:
             mtime_str = datetime.fromtimestamp(mtime).strftime('%Y-%m-%d %H:%M:%S')
-            print(f"   ✅ {name:<18}: {filename:<75} ({size:>10,} bytes, {mtime_str})")
+            lines.append(f"   ✅ {name:<18}: {filename:<75} ({size:>10,} bytes, {mtime_str})")
         else:
-            print(f"   ❌ {name:<18}: {filename:<75} (missing)")
+            lines.append(f"   ❌ {name:<18}: {filename:<75} (missing)")
+    print("\n".join(lines))
 
 def run_bwv_script(script_name, *args):
     """
@@ -395,13 +561,12 @@ def run_bwv_script(script_name, *args):
         CompletedProcess result
     """
     # Find the script relative to tasks_utils.py location
-    tasks_dir = Path(__file__).parent  # where tasks_utils.py is (invoke dir)
-    script_path = tasks_dir.parent / 'python' / script_name
+    script_path = SCRIPTS_DIR / script_name
     
     if not script_path.exists():
         gentle_exit(f"BWV script not found: {script_path}")
     
-    # Get project name from detect_project_name
+    # Get project name from detect_project_name (cached after the first call)
     project_name = detect_project_name()
     
     # Set up environment with PROJECT_NAME
@@ -436,4 +601,228 @@ def run_bwv_script(script_name, *args):
         from subprocess import CalledProcessError
         raise CalledProcessError(result.returncode, cmd, result.stdout, result.stderr)
     
-    return result
\ No newline at end of file
+    return result
+
+# ==============================================================================
+# PERSISTENT LILYPOND CONTAINER
+# ==============================================================================
+
+LILYPOND_IMAGE = "codello/lilypond:dev"
+LILYPOND_INCLUDES = (TASKS_DIR / ".." / "lilypond" / "includes").resolve()
+
+# One-shot "docker run [-v ...] codello/lilypond:dev" prefix of generated commands
+_LILYPOND_RUN_RE = re.compile(r"docker run(?:\s+-v\s+\S+)*\s+" + re.escape(LILYPOND_IMAGE) + r"(?=\s|$)")
+
+def lily_container_name(project_name=None):
+    """Name of the persistent LilyPond container for a project."""
+    return f"bwv-lily-{project_name or detect_project_name()}"
+
+@lru_cache(maxsize=None)
+def running_lily_container(name):
+    """Return the container name if it is running, None otherwise (checked once per process)."""
+    try:
+        result = subprocess.run(['docker', 'inspect', '-f', '{{.State.Running}}', name],
+                                capture_output=True, text=True)
+    except FileNotFoundError:
+        return None
+    return name if result.returncode == 0 and result.stdout.strip() == "true" else None
+
+def lily_exec(cmd):
+    """
+    Route a one-shot LilyPond "docker run" through "docker exec" on the
+    persistent container, so Guile/LilyPond startup is paid only once.
+    
+    Args:
+        cmd: Shell command as generated from tasks.mmd
+        
+    Returns:
+        str: The rewritten command, or cmd unchanged if no container is running
+    """
+    if LILYPOND_IMAGE not in cmd:
+        return cmd
+    container = running_lily_container(lily_container_name())
+    if not container:
+        return cmd
+    return _LILYPOND_RUN_RE.sub(f"docker exec -w /work {container} lilypond", cmd, count=1)
+
+def lily_container_up(c):
+    """Start the persistent LilyPond container for the current project."""
+    name = lily_container_name()
+    running_lily_container.cache_clear()
+    if running_lily_container(name):
+        print(f"🐳 LilyPond container already running: {name}")
+        return
+    
+    # Remove a stopped container left over from a previous session
+    c.run(f"docker rm -f {name}", hide=True, warn=True)
+    result = c.run(
+        f'docker run -d --name {name} '
+        f'-e GUILE_AUTO_COMPILE=1 '
+        f'-v "{LILYPOND_INCLUDES}":/work/includes -v "{Path.cwd()}":/work '
+        f'--entrypoint sleep {LILYPOND_IMAGE} infinity',
+        hide=True, warn=True,
+    )
+    if not result.ok:
+        gentle_exit(f"Could not start LilyPond container '{name}': {result.stderr.strip()}")
+    
+    running_lily_container.cache_clear()
+    print(f"🐳 LilyPond container started: {name} ({result.stdout.strip()[:12]})")
+
+def lily_container_down(c):
+    """Stop and remove the persistent LilyPond container for the current project."""
+    name = lily_container_name()
+    result = c.run(f"docker rm -f {name}", hide=True, warn=True)
+    running_lily_container.cache_clear()
+    if result.ok:
+        print(f"🗑️ LilyPond container removed: {name}")
+    else:
+        print(f"🐳 No LilyPond container to remove: {name}")
+
+# ==============================================================================
+# PIPELINE SCHEDULING
+# ==============================================================================
+
+def dependency_levels(dependencies, targets):
+    """
+    Group the tasks needed to build targets into dependency levels.
+    
+    Level 0 holds tasks without prerequisites; every later level only depends
+    on tasks from earlier levels, so the tasks within one level are independent.
+    
+    Args:
+        dependencies: Dict {task: [prerequisite tasks]} in dependency order
+        targets: Tasks to build
+        
+    Returns:
+        list: One list of tasks per level
+    """
+    # Collect targets and everything they transitively depend on
+    needed = set()
+    stack = list(targets)
+    while stack:
+        current = stack.pop()
+        if current not in needed:
+            needed.add(current)
+            stack.extend(dependencies.get(current, []))
+    
+    order = [t for t in dependencies if t in needed]
+    position = {t: i for i, t in enumerate(order)}
+    in_degree = {t: len(dependencies[t]) for t in order}
+    dependents = defaultdict(list)
+    for t in order:
+        for dep in dependencies[t]:
+            dependents[dep].append(t)
+    
+    levels = []
+    scheduled = 0
+    ready = [t for t in order if in_degree[t] == 0]
+    while ready:
+        levels.append(ready)
+        scheduled += len(ready)
+        next_ready = []
+        for t in ready:
+            for dependent in dependents[t]:
+                in_degree[dependent] -= 1
+                if in_degree[dependent] == 0:
+                    next_ready.append(dependent)
+        ready = sorted(next_ready, key=position.__getitem__)
+    
+    if scheduled < len(order):
+        blocked = ', '.join(getattr(t, 'name', str(t)) for t in order if in_degree[t] > 0)
+        gentle_exit(f"Circular dependency between tasks: {blocked}")
+    
+    return levels
+
+def run_task_graph(c, dependencies, targets, force=False, jobs=1):
+    """
+    Run the tasks needed for targets, starting each one as soon as its own
+    prerequisites are done (Kahn's algorithm over a ready set).
+    
+    Unlike a level-by-level run, a task does not wait for unrelated tasks of
+    the previous level, so with jobs > 1 the pool stays busy across levels.
+    Tasks are mostly subprocess launches (LilyPond in Docker, Python scripts),
+    so threads are enough to keep several of them busy.
+    
+    Args:
+        c: Invoke context
+        dependencies: Dict {task: [prerequisite tasks]} in dependency order
+        targets: Tasks to build
+        force: If True, force rebuild regardless of cache
+        jobs: Maximum number of tasks running at the same time
+    """
+    levels = dependency_levels(dependencies, targets)  # Also rejects cycles
+    
+    # The include tree and file stats are cached for one run only
+    get_shared_ly_sources.cache_clear()
+    _STAT_CACHE.clear()
+    
+    order = [t for level in levels for t in level]
+    if jobs <= 1:
+        for t in order:
+            t(c, force=force)
+        return
+    
+    position = {t: i for i, t in enumerate(order)}
+    remaining = {t: len(dependencies[t]) for t in order}
+    dependents = defaultdict(list)
+    for t in order:
+        for dep in dependencies[t]:
+            dependents[dep].append(t)
+    
+    # Imported here: only parallel builds need the thread pool machinery
+    from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+    ready = list(levels[0]) if levels else []
+    running = {}
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        while ready or running:
+            # Start ready tasks in dependency order while workers are free
+            while ready and len(running) < jobs:
+                t = ready.pop(0)
+                running[executor.submit(t, c, force=force)] = t
+            
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                t = running.pop(future)
+                future.result()  # Re-raise failures (including gentle_exit)
+                for dependent in dependents[t]:
+                    remaining[dependent] -= 1
+                    if remaining[dependent] == 0:
+                        ready.append(dependent)
+            ready.sort(key=position.__getitem__)
+
+def critical_path(dependencies, durations):
+    """
+    Find the critical (longest) path through the task graph.
+    
+    Single pass in dependency order: a task starts as soon as its slowest
+    prerequisite finishes, so each edge is relaxed exactly once.
+    
+    Args:
+        dependencies: Dict {task: [prerequisite tasks]} in dependency order
+        durations: Dict {task: seconds}; tasks without a duration count as 0
+        
+    Returns:
+        tuple: (total_seconds, [tasks along the critical path])
+    """
+    finish = {}
+    slowest_dep = {}
+    for t, deps in dependencies.items():
+        start = 0.0
+        slowest_dep[t] = None
+        for dep in deps:
+            if finish.get(dep, 0.0) > start:
+                start = finish[dep]
+                slowest_dep[t] = dep
+        finish[t] = start + durations.get(t, 0.0)
+    
+    if not finish:
+        return 0.0, []
+    
+    # Walk back from the task that finishes last
+    last = max(finish, key=finish.get)
+    path = []
+    while last is not None:
+        path.append(last)
+        last = slowest_dep[last]
+    
+    return finish[path[0]], path[::-1]
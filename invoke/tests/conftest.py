@@ -0,0 +1,36 @@
+"""
+Shared pytest setup: make the invoke modules importable from the tests.
+
+The generated ANTLR classes (antlr/build_antlr.sh) are not committed. When
+they are missing, empty stand-ins are registered so the mermaid modules still
+import; tests then build listeners by hand instead of running the parser.
+
+Run from the invoke directory:  python -m pytest -q tests
+"""
+
+import sys
+import types
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+class _TokenTypes(type):
+    """Metaclass answering any token/rule constant lookup with an int."""
+    def __getattr__(cls, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        return hash(name) & 0xFFFF
+
+def _install_antlr_stubs():
+    """Register stand-ins for the generated lexer, parser and listener."""
+    for name in ('MermaidPipelineLexer', 'MermaidPipelineParser', 'MermaidPipelineParserListener'):
+        module = types.ModuleType(f'antlr.{name}')
+        module.__file__ = __file__
+        module_class = _TokenTypes(name, (), {'__module__': module.__name__})
+        setattr(module, name, module_class)
+        sys.modules[module.__name__] = module
+
+try:
+    import antlr.MermaidPipelineParser  # noqa: F401
+except ImportError:
+    _install_antlr_stubs()
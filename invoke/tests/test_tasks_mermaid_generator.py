@@ -0,0 +1,134 @@
+"""
+Tests for the per-task codegen cache and the skip-regeneration stamp in
+tasks_mermaid_generator.
+
+Listeners are built by hand, so these tests do not need the ANTLR parser.
+"""
+
+import pytest
+
+import tasks_mermaid_generator
+from tasks_mermaid_generator import (
+    SOURCE_DIGEST_KEY,
+    generate_full_tasks,
+    generate_tasks_file,
+    is_output_current,
+    load_codegen_cache,
+    task_codegen_key,
+)
+from tasks_mermaid_utils import MermaidDisplayListener, MermaidNode
+
+# I1 -> T1 -> R1 -> E1 (PDF) and I1 -> T2 -> R2 -> O1 -> T3 -> R3 -> O2 (SVG)
+NODES = [
+    ('I1', 'BWV000.ly'),
+    ('T1', 'pdf'),
+    ('T2', 'svg'),
+    ('T3', 'no_tabs'),
+    ('R1', 'docker run -v PWD:/work codello/lilypond:dev INCLUDES BWV000.ly'),
+    ('R2', 'docker run -v PWD:/work codello/lilypond:dev INCLUDES --svg BWV000.ly'),
+    ('R3', 'bwv_script:no_hrefs_in_tabs.py BWV000.svg'),
+    ('O1', 'BWV000.svg'),
+    ('O2', 'BWV000_no_hrefs_in_tabs.svg'),
+    ('E1', 'exports/BWV000.pdf'),
+]
+EDGES = [
+    ('I1', 'T1'), ('T1', 'R1'), ('R1', 'E1'),
+    ('I1', 'T2'), ('T2', 'R2'), ('R2', 'O1'),
+    ('O1', 'T3'), ('T3', 'R3'), ('R3', 'O2'),
+]
+
+def make_listener(nodes=NODES, edges=EDGES):
+    """A listener populated the way the ANTLR hooks fill it, without parsing."""
+    listener = MermaidDisplayListener()
+    for node_id, content in nodes:
+        listener._add_node(MermaidNode(id=node_id, type=node_id[0], content=content, description=''))
+    for from_node, to_node in edges:
+        listener._add_edge(from_node, to_node)
+    return listener
+
+def with_content(node_id, content):
+    """NODES with one node's content replaced."""
+    return [(i, content if i == node_id else c) for i, c in NODES]
+
+def codegen_keys(listener):
+    """{task name: codegen key} for every task of a listener."""
+    return {node.content: task_codegen_key(node, listener) for node in listener.nodes_by_type['T']}
+
+def test_codegen_cache_reproduces_fresh_output():
+    listener = make_listener()
+    fresh = generate_tasks_file(listener)
+    cache = {}
+    assert generate_tasks_file(listener, cache) == fresh
+    assert len(cache) == 3
+    # Second run: every snippet comes from the cache
+    assert generate_tasks_file(listener, cache) == fresh
+
+def test_codegen_cache_reuses_cached_snippets():
+    listener = make_listener()
+    cache = {}
+    generate_tasks_file(listener, cache)
+    key = codegen_keys(listener)['pdf']
+    cache[key]['code'] = cache[key]['code'].replace('def pdf(', 'def pdf_from_cache(')
+    assert 'def pdf_from_cache(' in generate_tasks_file(listener, cache)
+
+def test_codegen_key_follows_task_neighbourhood():
+    keys = codegen_keys(make_listener())
+    # A new runnable command only invalidates the task that runs it
+    changed = codegen_keys(make_listener(with_content('R3', 'bwv_script:other.py BWV000.svg')))
+    assert changed['no_tabs'] != keys['no_tabs']
+    assert changed['pdf'] == keys['pdf']
+    assert changed['svg'] == keys['svg']
+    # Renaming a task also invalidates the tasks that list it as a prerequisite
+    changed = codegen_keys(make_listener(with_content('T2', 'svg_pages')))
+    assert changed['svg_pages'] != keys['svg']
+    assert changed['no_tabs'] != keys['no_tabs']
+    assert changed['pdf'] == keys['pdf']
+
+def test_codegen_keys_change_with_parser_or_includes(monkeypatch):
+    keys = codegen_keys(make_listener())
+    # _CODEGEN_HASH covers the generator, the parser and the includes path
+    monkeypatch.setattr(tasks_mermaid_generator, '_CODEGEN_HASH', 'moved checkout')
+    changed = codegen_keys(make_listener())
+    assert all(changed[name] != keys[name] for name in keys)
+
+# =============================================================================
+# SKIP-REGENERATION STAMP
+# =============================================================================
+
+@pytest.fixture
+def generated(tmp_path, monkeypatch):
+    """Generate tasks as main() does, from the hand-built diagram; return the paths."""
+    monkeypatch.setattr(tasks_mermaid_generator, 'load_mermaid', lambda mermaid_file: make_listener())
+    mermaid_file = tmp_path / "tasks.mmd"
+    mermaid_file.write_text("graph TD\n")
+    output = tmp_path / "tasks_generated.py"
+    cache_file = tmp_path / ".task_gen_cache.json"
+
+    def generate():
+        output.write_text(generate_full_tasks(mermaid_file, cache_file))
+
+    generate()
+    return mermaid_file, output, cache_file, generate
+
+def test_output_current_after_generation(generated):
+    mermaid_file, output, cache_file, _ = generated
+    assert SOURCE_DIGEST_KEY in load_codegen_cache(cache_file)
+    assert is_output_current(mermaid_file, output, cache_file)
+
+def test_output_stale_after_mermaid_edit(generated):
+    mermaid_file, output, cache_file, _ = generated
+    mermaid_file.write_text("graph LR\n")
+    assert not is_output_current(mermaid_file, output, cache_file)
+
+def test_output_stale_after_output_edit_or_removal(generated):
+    mermaid_file, output, cache_file, generate = generated
+    output.write_text(output.read_text() + "# edited\n")
+    assert not is_output_current(mermaid_file, output, cache_file)
+    generate()
+    output.unlink()
+    assert not is_output_current(mermaid_file, output, cache_file)
+
+def test_output_stale_after_parser_or_includes_change(generated, monkeypatch):
+    mermaid_file, output, cache_file, _ = generated
+    monkeypatch.setattr(tasks_mermaid_generator, '_CODEGEN_HASH', 'moved checkout')
+    assert not is_output_current(mermaid_file, output, cache_file)
@@ -0,0 +1,85 @@
+"""
+Tests for the on-disk parse cache in tasks_mermaid_utils.
+
+The ANTLR parse itself is replaced by a stand-in that counts its calls, so
+these tests do not need the generated parser.
+"""
+
+import pytest
+
+import tasks_mermaid_utils
+from tasks_mermaid_utils import (
+    MermaidDisplayListener,
+    _categorize_file_nodes,
+    _load_listener,
+    _parse_cache_path,
+    load_mermaid,
+)
+
+STATE = {
+    'nodes': [['I1', 'I', 'BWV000.ly', 'Main Score'], ['T1', 'T', 'pdf', '']],
+    'edges': [['I1', 'T1']],
+    'class_defs': [],
+    'class_assignments': [],
+    'graph_direction': 'TD',
+    'init_content': None,
+    'char_count': 0,
+}
+
+@pytest.fixture
+def parses(monkeypatch):
+    """Replace the ANTLR parse with a stand-in; returns the list of parsed sources."""
+    calls = []
+
+    def parse_content(content):
+        calls.append(content)
+        return MermaidDisplayListener.from_state(dict(STATE, char_count=len(content)))
+
+    monkeypatch.setattr(tasks_mermaid_utils, '_parse_content', parse_content)
+    _load_listener.cache_clear()
+    yield calls
+    _load_listener.cache_clear()
+
+@pytest.fixture
+def mermaid_file(tmp_path):
+    path = tmp_path / "tasks.mmd"
+    path.write_text("graph TD\nI1[BWV000.ly]\nT1[pdf]\nI1 --> T1\n")
+    return path
+
+def test_parse_cached_in_process(mermaid_file, parses):
+    assert load_mermaid(mermaid_file) is load_mermaid(mermaid_file)
+    assert len(parses) == 1
+
+def test_parse_cache_reused_by_a_new_process(mermaid_file, parses):
+    first = load_mermaid(mermaid_file)
+    assert _parse_cache_path(mermaid_file).exists()
+    # A new process only has the on-disk cache
+    _load_listener.cache_clear()
+    second = load_mermaid(mermaid_file)
+    assert len(parses) == 1
+    assert second is not first
+    assert second.to_state() == first.to_state()
+
+def test_parse_cache_invalidated_by_content(mermaid_file, parses):
+    load_mermaid(mermaid_file)
+    mermaid_file.write_text(mermaid_file.read_text() + "T1 --> R1\n")
+    load_mermaid(mermaid_file)
+    assert len(parses) == 2
+
+def test_parse_cache_invalidated_by_parser(mermaid_file, parses, monkeypatch):
+    load_mermaid(mermaid_file)
+    _load_listener.cache_clear()
+    monkeypatch.setattr(tasks_mermaid_utils, '_PARSER_HASH', 'another parser')
+    load_mermaid(mermaid_file)
+    assert len(parses) == 2
+
+def test_corrupt_parse_cache_is_ignored(mermaid_file, parses):
+    _parse_cache_path(mermaid_file).write_text("{not json")
+    assert load_mermaid(mermaid_file).edges == [('I1', 'T1')]
+    assert len(parses) == 1
+
+def test_cache_clear_releases_derived_caches(mermaid_file, parses):
+    _categorize_file_nodes(load_mermaid(mermaid_file))
+    load_mermaid.cache_clear()
+    assert _load_listener.cache_info().currsize == 0
+    assert _categorize_file_nodes.cache_info().currsize == 0
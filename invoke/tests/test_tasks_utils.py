@@ -0,0 +1,160 @@
+"""
+Tests for the pipeline scheduling, critical path and LilyPond container
+helpers in tasks_utils.
+"""
+
+import threading
+
+import pytest
+
+import tasks_utils
+from tasks_utils import (
+    LILYPOND_IMAGE,
+    cached_stat,
+    critical_path,
+    dependency_levels,
+    lily_exec,
+    run_task_graph,
+)
+
+# =============================================================================
+# DIAMOND DAG: a -> (b, c) -> d
+# =============================================================================
+
+def make_diamond(log, barrier=None):
+    """
+    Build a diamond of tasks that record their start and end in log.
+    When a barrier is given, b and c both wait on it, so they only finish
+    if they run at the same time.
+    """
+    lock = threading.Lock()
+
+    def make_task(name):
+        def task(c, force=False):
+            with lock:
+                log.append(('start', name))
+            if barrier is not None and name in ('b', 'c'):
+                barrier.wait()
+            with lock:
+                log.append(('end', name))
+        task.__name__ = name
+        return task
+
+    a, b, c, d = (make_task(name) for name in 'abcd')
+    return {a: [], b: [a], c: [a], d: [b, c]}
+
+def assert_prerequisites_first(log, dependencies):
+    """Every task starts only after all of its prerequisites have ended."""
+    assert len(log) == 2 * len(dependencies)
+    when = {event: i for i, event in enumerate(log)}
+    for task, deps in dependencies.items():
+        for dep in deps:
+            assert when[('end', dep.__name__)] < when[('start', task.__name__)]
+
+def started(log):
+    """Task names in the order they started."""
+    return [name for event, name in log if event == 'start']
+
+def test_dependency_levels_diamond():
+    dependencies = make_diamond([])
+    a, b, c, d = dependencies
+    assert dependency_levels(dependencies, [d]) == [[a], [b, c], [d]]
+
+def test_dependency_levels_only_needed_tasks():
+    dependencies = make_diamond([])
+    a, b, c, d = dependencies
+    assert dependency_levels(dependencies, [b]) == [[a], [b]]
+
+def test_dependency_levels_rejects_cycles():
+    dependencies = make_diamond([])
+    a, b, c, d = dependencies
+    dependencies[a] = [d]
+    with pytest.raises(SystemExit):
+        dependency_levels(dependencies, [d])
+
+def test_run_task_graph_diamond_serial():
+    log = []
+    dependencies = make_diamond(log)
+    d = list(dependencies)[-1]
+    run_task_graph(None, dependencies, [d])
+    assert started(log) == ['a', 'b', 'c', 'd']
+    assert_prerequisites_first(log, dependencies)
+
+def test_run_task_graph_diamond_parallel():
+    log = []
+    dependencies = make_diamond(log, barrier=threading.Barrier(2, timeout=5))
+    d = list(dependencies)[-1]
+    run_task_graph(None, dependencies, [d], jobs=4)
+    assert_prerequisites_first(log, dependencies)
+
+def test_run_task_graph_does_not_wait_for_unrelated_tasks():
+    # slow is still running on level 0 when fast's dependent must start
+    dependent_started = threading.Event()
+
+    def slow(c, force=False):
+        assert dependent_started.wait(timeout=5)
+
+    def fast(c, force=False):
+        pass
+
+    def after_fast(c, force=False):
+        dependent_started.set()
+
+    dependencies = {slow: [], fast: [], after_fast: [fast]}
+    run_task_graph(None, dependencies, [slow, after_fast], jobs=2)
+
+def test_run_task_graph_starts_with_fresh_stats(tmp_path):
+    source = tmp_path / "BWV000.ly"
+    source.write_text("{ c }")
+    before = cached_stat(source)
+    source.write_text("{ c d e }")  # edited outside the pipeline
+    assert cached_stat(source) == before
+    run_task_graph(None, {}, [])
+    assert cached_stat(source).st_size == len("{ c d e }")
+
+# =============================================================================
+# CRITICAL PATH
+# =============================================================================
+
+def test_critical_path_picks_slowest_branch():
+    dependencies = {'a': [], 'b': ['a'], 'c': ['a'], 'd': ['b', 'c']}
+    durations = {'a': 1.0, 'b': 2.0, 'c': 5.0, 'd': 1.0}
+    assert critical_path(dependencies, durations) == (7.0, ['a', 'c', 'd'])
+
+def test_critical_path_missing_durations_count_as_zero():
+    assert critical_path({'a': [], 'b': ['a']}, {'b': 3.0}) == (3.0, ['b'])
+    assert critical_path({}, {}) == (0.0, [])
+
+# =============================================================================
+# LILYPOND CONTAINER
+# =============================================================================
+
+# A LilyPond command as emitted by tasks_mermaid_generator
+GENERATED_LILY_CMD = (
+    f"docker run -v /repo/lilypond/includes:/work/includes -v /scores/bwv1006:/work "
+    f"{LILYPOND_IMAGE} -I /work/includes --svg bwv1006.ly"
+)
+
+@pytest.fixture
+def lily_container(monkeypatch):
+    """Pretend the project's LilyPond container is (or is not) running."""
+    monkeypatch.setattr(tasks_utils, 'lily_container_name', lambda: 'bwv-lily-bwv1006')
+
+    def set_running(running):
+        monkeypatch.setattr(tasks_utils, 'running_lily_container', lambda name: name if running else None)
+
+    return set_running
+
+def test_lily_exec_rewrites_generated_docker_run(lily_container):
+    lily_container(True)
+    assert lily_exec(GENERATED_LILY_CMD) == (
+        "docker exec -w /work bwv-lily-bwv1006 lilypond -I /work/includes --svg bwv1006.ly"
+    )
+
+def test_lily_exec_keeps_command_without_container(lily_container):
+    lily_container(False)
+    assert lily_exec(GENERATED_LILY_CMD) == GENERATED_LILY_CMD
+
+def test_lily_exec_ignores_other_commands(lily_container):
+    lily_container(True)
+    assert lily_exec("python3 -u extract.py in.svg") == "python3 -u extract.py in.svg"
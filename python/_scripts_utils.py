@@ -10,16 +10,23 @@ import os
 import sys
 import argparse
 import csv
-import pandas as pd
 import subprocess
-import yaml
 from pathlib import Path
 from functools import lru_cache
 
 @lru_cache(maxsize=None)
 def get_project_name():
-    """Detect project name from git repository root directory, fallback to current directory."""
-    project_name = None
+    """
+    Get the project name, resolved once per process.
+    
+    Uses the PROJECT_NAME environment variable set by the build system
+    (run_bwv_script); otherwise detects it from the git repository root
+    directory, falling back to the current directory.
+    Call get_project_name.cache_clear() to resolve it again.
+    """
+    project_name = os.environ.get("PROJECT_NAME")
+    if project_name:
+        return project_name
     
     # Try git first
     try:
@@ -60,6 +67,7 @@ def get_project_config(project_name):
     config_file = Path("exports") / f"{project_name}.config.yaml"
     
     if config_file.exists():
+        import yaml  # only scripts that read the project config need PyYAML
         with open(config_file) as f:
             return yaml.safe_load(f)
     return {}
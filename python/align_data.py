@@ -26,6 +26,7 @@ Pipeline:
 3. align-data.py (this script - alignment with tick timing preserved)
 """
 
+import numpy as np
 import pandas as pd
 import json
 import argparse
@@ -137,10 +138,13 @@ def main():
         # 3. Tertiary: MIDI pitch (ascending)
         print("📊 Sorting MIDI data for alignment...")
         
-        midi_df = midi_df.sort_values(
-            by=["on_tick", "channel", "midi"], 
-            ascending=[True, False, True]
-        ).reset_index(drop=True)
+        # One stable lexsort over the raw columns (the last key is the primary one)
+        order = np.lexsort((
+            midi_df["midi"].to_numpy(),
+            -midi_df["channel"].to_numpy(),
+            midi_df["on_tick"].to_numpy(),
+        ))
+        midi_df = midi_df.iloc[order].reset_index(drop=True)
 
         # DO NOT sort SVG data! It already has the correct tolerance-based ordering
         # from extract_note_heads.py -> squash_tied_note_heads.py pipeline
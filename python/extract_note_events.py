@@ -28,14 +28,25 @@ pitch,midi,channel,on_tick,off_tick,ticks_per_beat
 "c,",48,1,1920,2880,480
 """
 
-from mido import MidiFile
-import pandas as pd
+import numpy as np
 import csv
 import argparse
 import sys
 import os
+from collections import defaultdict, deque
 from _scripts_utils import midi_pitch_to_lilypond
 
+# LilyPond notation for every MIDI pitch (0-127), indexed by pitch number
+_PITCH_LUT = tuple(midi_pitch_to_lilypond(midi) for midi in range(128))
+
+# Messages that carry a note number but never start or end a note here:
+# note_off with a release velocity (as in the original extractor, only
+# velocity 0 ends a note) and polyphonic aftertouch
+_UNPAIRED_NOTE_TYPES = frozenset(('note_off', 'polytouch'))
+
+# CSV columns, in output order
+NOTE_EVENT_COLUMNS = ("pitch", "midi", "channel", "on_tick", "off_tick")
+
 def extract_note_intervals(midi_path):
     """
     Extract note events from a MIDI file preserving original MIDI timing.
@@ -48,20 +59,21 @@ def extract_note_intervals(midi_path):
         midi_path (str): Path to the MIDI file to process
         
     Returns:
-        tuple: (pandas.DataFrame, int) where:
-            DataFrame contains note events with columns:
-                - pitch: LilyPond notation string (e.g., "cis'", "f,,") - quoted in CSV due to commas
-                - midi: Original MIDI note number (0-127)
-                - on_tick: Start time in MIDI ticks (int)
-                - off_tick: End time in MIDI ticks (int) 
-                - channel: MIDI channel number
+        tuple: (dict, int) where:
+            dict maps each of NOTE_EVENT_COLUMNS to its sorted column:
+                - pitch: LilyPond notation strings (e.g., "cis'", "f,,") - quoted in CSV due to commas
+                - midi: Original MIDI note numbers (0-127)
+                - channel: MIDI channel numbers
+                - on_tick: Start times in MIDI ticks (int)
+                - off_tick: End times in MIDI ticks (int) 
             int: ticks_per_beat from the MIDI file
             
     Algorithm Details:
     - Uses a note stack to handle overlapping notes of the same pitch
     - Preserves original MIDI tick timing without conversion
-    - Handles both note_on (velocity > 0) and note_off events
-    - Treats note_on with velocity=0 as note_off (MIDI standard)
+    - A note starts with note_on (velocity > 0)
+    - A note ends with note_on or note_off with velocity=0; note_off with a
+      release velocity > 0 is ignored
     - Converts MIDI pitches to LilyPond notation for score alignment
     """
     
@@ -71,14 +83,17 @@ def extract_note_intervals(midi_path):
     # STEP 1: LOAD MIDI FILE AND EXTRACT TIMING INFORMATION
     # =================================================================
     
+    from mido import MidiFile  # deferred: --help and argument errors don't pay for it
+    
     midi_file = MidiFile(midi_path)
     ticks_per_beat = midi_file.ticks_per_beat  # MIDI timing resolution
     
     print(f"   📊 MIDI resolution: {ticks_per_beat} ticks per beat")
     
     # Data structures for note tracking
-    note_stack = {}      # Track overlapping notes: {pitch: [(start_tick, channel), ...]}
-    note_events = []     # Final list of completed note events
+    note_stack = defaultdict(deque)  # Track overlapping notes: {pitch: deque([(start_tick, channel), ...])}
+    # Completed note events, one column per field (one entry per note)
+    midi_col, channel_col, on_tick_col, off_tick_col = [], [], [], []
     current_tick = 0     # Running total of elapsed MIDI ticks
     max_tick = 0         # Total duration of MIDI file in ticks
     
@@ -88,68 +103,90 @@ def extract_note_intervals(midi_path):
     # STEP 2: PROCESS ALL MIDI MESSAGES SEQUENTIALLY  
     # =================================================================
     
-    # =================================================================
-    # STEP 2: PROCESS ALL MIDI MESSAGES SEQUENTIALLY  
-    # =================================================================
+    # Collect note messages from all tracks as parallel columns, so the
+    # message objects are only touched once: absolute tick, pitch, channel
+    # and whether the message starts (True) or ends (False) a note
+    ticks, pitches, channels, starts = [], [], [], []
     
-    # Collect all messages from all tracks with their absolute tick times
-    all_messages = []
+    # Messages with a note number, including those skipped below (reported)
+    note_messages = 0
     
-    for track_idx, track in enumerate(midi_file.tracks):
+    # Bound once: the loops below run per message / per note
+    add_tick, add_pitch, add_channel, add_start = ticks.append, pitches.append, channels.append, starts.append
+    
+    for track in midi_file.tracks:
         current_tick = 0
         for message in track:
             # Advance timeline by message's delta time (in raw ticks)
             current_tick += message.time
             
-            # Only process note events (skip meta messages)
-            if hasattr(message, 'note'):
-                all_messages.append((current_tick, message))
+            # Only process note events: note start (note_on with velocity > 0)
+            # or note end (note_on or note_off with velocity=0); meta and
+            # other messages are skipped after a single type test
+            msg_type = message.type
+            if msg_type == 'note_on':
+                is_start = message.velocity > 0
+            elif msg_type == 'note_off' and message.velocity == 0:
+                is_start = False
+            else:
+                if msg_type in _UNPAIRED_NOTE_TYPES:
+                    note_messages += 1
+                continue
             
-            # Track maximum tick value across all tracks
-            max_tick = max(max_tick, current_tick)
+            add_tick(current_tick)
+            add_pitch(message.note)
+            add_channel(message.channel)
+            add_start(is_start)
+        
+        # Delta times are non-negative, so a track ends at its largest tick;
+        # track the maximum across all tracks
+        max_tick = max(max_tick, current_tick)
+    
+    # Chronological order; the stable sort keeps simultaneous messages in
+    # track order, then in their order within the track
+    order = np.argsort(np.array(ticks, dtype=np.int64), kind='stable').tolist()
     
-    # Sort all messages by absolute tick time for chronological processing
-    all_messages.sort(key=lambda x: x[0])
+    note_messages += len(ticks)
+    print(f"   🎵 Processing {note_messages} note messages from {len(midi_file.tracks)} tracks")
     
-    print(f"   🎵 Processing {len(all_messages)} note messages from {len(midi_file.tracks)} tracks")
+    add_midi, add_note_channel = midi_col.append, channel_col.append
+    add_on_tick, add_off_tick = on_tick_col.append, off_tick_col.append
+    pending_notes = note_stack.get
     
     # Process messages in chronological order
-    for abs_tick, message in all_messages:
+    for i in order:
+        abs_tick, note = ticks[i], pitches[i]
+        
         # Handle note start events
-        if message.type == 'note_on' and message.velocity > 0:
+        if starts[i]:
             # Push note onto stack (handles multiple simultaneous notes of same pitch)
-            if message.note not in note_stack:
-                note_stack[message.note] = []
-            note_stack[message.note].append((abs_tick, message.channel))
-            
-        # Handle note end events (note_off OR note_on with velocity=0)
-        elif message.type in ('note_off', 'note_on') and message.velocity == 0:
+            note_stack[note].append((abs_tick, channels[i]))
+            continue
+        
+        # Handle note end events
+        pending = pending_notes(note)
+        if pending:
             # Pop matching note from stack (FIFO order for overlapping notes)
-            if note_stack.get(message.note):
-                start_tick, channel = note_stack[message.note].pop(0)
-                
-                # Create completed note event with original MIDI timing
-                note_event = {
-                    "midi": message.note,           # Original MIDI pitch number
-                    "on_tick": int(start_tick),     # Start time in MIDI ticks (ensure integer)
-                    "off_tick": int(abs_tick),      # End time in MIDI ticks (ensure integer)
-                    "channel": channel
-                }
-                note_events.append(note_event)
-    
-    print(f"   🎹 Extracted {len(note_events)} note events")
+            start_tick, channel = pending.popleft()
+            
+            # Record completed note event with original MIDI timing
+            add_midi(note)                      # Original MIDI pitch number
+            add_note_channel(channel)
+            add_on_tick(int(start_tick))        # Start time in MIDI ticks (ensure integer)
+            add_off_tick(int(abs_tick))         # End time in MIDI ticks (ensure integer)
+    
+    print(f"   🎹 Extracted {len(midi_col)} note events")
     print(f"   ⏱️  MIDI duration: {max_tick} ticks")
     
     # Verify all tick values are integers
-    if note_events:
-        sample_note = note_events[0]
-        print(f"   🔍 Tick verification: on_tick={sample_note['on_tick']} (type: {type(sample_note['on_tick'])})")
-        print(f"   🔍 Tick verification: off_tick={sample_note['off_tick']} (type: {type(sample_note['off_tick'])})")
+    if midi_col:
+        print(f"   🔍 Tick verification: on_tick={on_tick_col[0]} (type: {type(on_tick_col[0])})")
+        print(f"   🔍 Tick verification: off_tick={off_tick_col[0]} (type: {type(off_tick_col[0])})")
         
         # Check for any non-integer values
         non_integers = []
-        for i, note in enumerate(note_events[:10]):  # Check first 10 notes
-            if not isinstance(note['on_tick'], int) or not isinstance(note['off_tick'], int):
+        for i, (on_tick, off_tick) in enumerate(zip(on_tick_col[:10], off_tick_col[:10])):  # Check first 10 notes
+            if not isinstance(on_tick, int) or not isinstance(off_tick, int):
                 non_integers.append(i)
         
         if non_integers:
@@ -163,44 +200,64 @@ def extract_note_intervals(midi_path):
     
     print("🎼 Converting MIDI pitches to LilyPond notation...")
     
-    for note_event in note_events:
-        # Convert MIDI pitch to LilyPond notation
-        note_event["pitch"] = midi_pitch_to_lilypond(note_event["midi"])
+    midi_arr = np.array(midi_col, dtype=np.int64)
+    channel_arr = np.array(channel_col, dtype=np.int64)
+    on_tick_arr = np.array(on_tick_col, dtype=np.int64)
+    off_tick_arr = np.array(off_tick_col, dtype=np.int64)
     
     # =================================================================
     # STEP 4: SORT AND ORGANIZE RESULTS
     # =================================================================
     
-    # Convert to DataFrame for easier manipulation and export
-    note_events_df = pd.DataFrame(note_events)
-    
-    # Reorder columns to match format: pitch, midi, channel, on_tick, off_tick
-    note_events_df = note_events_df[["pitch", "midi", "channel", "on_tick", "off_tick"]]
-    
-    # Sort by musical priority:
+    # Sort by musical priority (stable; the last key is the primary one):
     # 1. Start time (chronological order)
     # 2. Channel (higher channels first - often melody vs accompaniment)
     # 3. MIDI pitch (ascending - bass to treble within simultaneous events)
-    note_events_df = note_events_df.sort_values(
-        by=["on_tick", "channel", "midi"], 
-        ascending=[True, False, True]
-    )
+    order = np.lexsort((midi_arr, -channel_arr, on_tick_arr))
+    midi_arr = midi_arr[order]
+    
+    note_events = {
+        "pitch": [_PITCH_LUT[midi] for midi in midi_arr.tolist()],  # Table lookup per note
+        "midi": midi_arr,
+        "channel": channel_arr[order],
+        "on_tick": on_tick_arr[order],
+        "off_tick": off_tick_arr[order],
+    }
     
-    print(f"✅ Extracted {len(note_events_df)} notes with original MIDI timing")
+    print(f"✅ Extracted {len(midi_arr)} notes with original MIDI timing")
     
     # Timing information
-    if len(note_events_df) > 0:
-        final_tick = note_events_df["off_tick"].max()
+    if len(midi_arr) > 0:
+        final_tick = note_events["off_tick"].max()
         print(f"   📏 Final timing: {final_tick} ticks")
         print(f"   🎯 Resolution: {ticks_per_beat} ticks per beat")
         
         # Show some examples of the pitch conversion
         print("   🎼 Sample pitch conversions:")
-        sample_notes = note_events_df.head(5)
-        for _, note in sample_notes.iterrows():
-            print(f"      MIDI {note['midi']} -> '{note['pitch']}' ({note['on_tick']}-{note['off_tick']} ticks)")
+        sample_notes = zip(*(note_events[column][:5] for column in NOTE_EVENT_COLUMNS))
+        for pitch, midi, _, on_tick, off_tick in sample_notes:
+            print(f"      MIDI {midi} -> '{pitch}' ({on_tick}-{off_tick} ticks)")
+    
+    return note_events, ticks_per_beat
+
+def write_note_events_csv(note_events, output_path):
+    """
+    Stream note events to CSV, one row per note in NOTE_EVENT_COLUMNS order.
+    
+    Uses QUOTE_NONNUMERIC to properly handle LilyPond notation with commas
+    (e.g., "c,", "c,,"): pitch values are quoted, numbers are not.
+    
+    Args:
+        note_events (dict): Columns as returned by extract_note_intervals
+        output_path (str): Output CSV file path
+    """
+    columns = [note_events[column] for column in NOTE_EVENT_COLUMNS]
+    columns = [column.tolist() if isinstance(column, np.ndarray) else column for column in columns]
     
-    return note_events_df, ticks_per_beat
+    with open(output_path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f, quoting=csv.QUOTE_NONNUMERIC, lineterminator='\n')
+        writer.writerow(NOTE_EVENT_COLUMNS)
+        writer.writerows(zip(*columns))
 
 # =============================================================================
 # MAIN EXECUTION
@@ -250,7 +307,7 @@ def main():
     
     # Process MIDI file
     try:
-        note_events_df, ticks_per_beat = extract_note_intervals(midi_file_path)
+        note_events, ticks_per_beat = extract_note_intervals(midi_file_path)
         
         # Ensure output directory exists
         output_dir = os.path.dirname(output_file_path)
@@ -260,30 +317,31 @@ def main():
         # Export results
         print(f"\n💾 Saving note data with original timing...")
         
-        # Use QUOTE_NONNUMERIC to properly handle LilyPond notation with commas (e.g., "c,", "c,,")
-        # This ensures pitch column values like "c," are quoted as "c," in the CSV
-        note_events_df.to_csv(output_file_path, index=False, quoting=csv.QUOTE_NONNUMERIC)
+        # Pitch column values like "c," are quoted as "c," in the CSV
+        write_note_events_csv(note_events, output_file_path)
         
         ## # Also save timing metadata as a comment in a separate file for JavaScript to read
         ## metadata_file = output_file_path.replace('.csv', '_metadata.json')
         ## import json
         ## metadata = {
         ##     "ticks_per_beat": ticks_per_beat,
-        ##     "total_notes": len(note_events_df),
-        ##     "max_tick": int(note_events_df["off_tick"].max()) if len(note_events_df) > 0 else 0,
-        ##     "unique_pitches": int(note_events_df["pitch"].nunique()) if len(note_events_df) > 0 else 0,
-        ##     "channels_used": int(note_events_df["channel"].nunique()) if len(note_events_df) > 0 else 0
+        ##     "total_notes": len(note_events["midi"]),
+        ##     "max_tick": int(note_events["off_tick"].max()) if len(note_events["midi"]) > 0 else 0,
+        ##     "unique_pitches": len(set(note_events["pitch"])),
+        ##     "channels_used": len(np.unique(note_events["channel"]))
         ## }
         ## 
         ## with open(metadata_file, 'w') as f:
         ##     json.dump(metadata, f, indent=2)
         
         # Summary statistics
-        total_notes = len(note_events_df)
-        max_tick = note_events_df["off_tick"].max() if total_notes > 0 else 0
-        unique_pitches = note_events_df["pitch"].nunique() if total_notes > 0 else 0
-        unique_midi_pitches = note_events_df["midi"].nunique() if total_notes > 0 else 0
-        channels_used = note_events_df["channel"].nunique() if total_notes > 0 else 0
+        total_notes = len(note_events["midi"])
+        max_tick = note_events["off_tick"].max() if total_notes > 0 else 0
+        midi_pitches = np.unique(note_events["midi"])
+        unique_midi_pitches = len(midi_pitches)
+        # Pitch names derive from MIDI pitches, so only the distinct ones are looked at
+        unique_pitches = len({_PITCH_LUT[midi] for midi in midi_pitches.tolist()})
+        channels_used = len(np.unique(note_events["channel"]))
         
         print(f"✅ Export complete!")
         print(f"   📁 Note data: {output_file_path}")